@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of dictionaries of permutations.py.
+
+For every way to keep the word list prints time to load it, memory of
+Python objects after load (tracemalloc; mapped files are not counted,
+their sizes are printed separately) and time of queries.
+
+Usage (from root of repository):
+    python -m tasks.other.benchmark_permutations [words file] [queries]
+
+Number of queries is 1000 by default.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from tasks.other import permutations
+
+
+def measure(load):
+    """Load dictionary twice: for time and for memory.
+
+    :param load: function without arguments
+    :return: tuple (loaded object, seconds, bytes)
+    """
+    started = time.perf_counter()
+    loaded = load()
+    seconds = time.perf_counter() - started
+    del loaded
+
+    tracemalloc.start()
+    loaded = load()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return loaded, seconds, memory
+
+
+def make_queries(words, count, seed=0):
+    """Shuffled letters of random words of 5-9 letters."""
+    rand = random.Random(seed)
+    words = [word for word in words if 5 <= len(word) <= 9]
+    return [''.join(rand.sample(word, len(word)))
+            for word in rand.sample(words, min(count, len(words)))]
+
+
+def main():
+    """Print table of load time, memory and query time."""
+    words_file = sys.argv[1] if len(sys.argv) > 1 else permutations.WORDS_FILE
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    base = os.path.splitext(words_file)[0]
+    # saved files are made before measuring
+    permutations.SignatureIndex.open(words_file).close()
+    permutations.PackedTrie.open(words_file).close()
+    words = permutations.load_words(words_file)
+    queries = make_queries(words, count)
+
+    variants = [
+        ('list of words', lambda: permutations.load_words(words_file),
+         None, words_file),
+        ('trie of dicts',
+         lambda: permutations.build_trie(permutations.load_words(words_file)),
+         lambda trie, letters: permutations.find_words(letters, trie),
+         None),
+        ('signature index (mmap)',
+         lambda: permutations.SignatureIndex.load(base + '.idx'),
+         lambda index, letters: index.find_words(letters), base + '.idx'),
+        ('packed DAWG (mmap)',
+         lambda: permutations.PackedTrie.load(base + '.dawg'),
+         lambda dawg, letters: permutations.find_words(letters, dawg.root),
+         base + '.dawg'),
+    ]
+
+    print('{0} words, {1} queries'.format(len(words), len(queries)))
+    print('{0:<24}{1:>12}{2:>14}{3:>12}{4:>14}'.format(
+        '', 'load, ms', 'memory, KiB', 'file, KiB', 'query, ms'))
+    for name, load, query, path in variants:
+        loaded, seconds, memory = measure(load)
+        query_ms = ''
+        if query is not None:
+            started = time.perf_counter()
+            for letters in queries:
+                query(loaded, letters)
+            query_ms = '{0:.3f}'.format(
+                (time.perf_counter() - started) / len(queries) * 1000)
+        file_size = '{0:.0f}'.format(os.path.getsize(path) / 1024.0) \
+            if path else ''
+        print('{0:<24}{1:>12.2f}{2:>14.0f}{3:>12}{4:>14}'.format(
+            name, seconds * 1000, memory / 1024.0, file_size, query_ms))
+        if hasattr(loaded, 'close'):
+            loaded.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Microbenchmark of pure-Python part of media sorter.
+
+Synthetic metadata records (like ones from get_files_with_date) go through
+the same steps as in Sorter.plan_move, but nothing is read from disk:
+    get_date -> parse_date -> format_filename_from_data -> future path ->
+    free name in DuplicateIndex (in memory).
+
+Usage (from root of repository):
+    python -m tasks.other.media_sorter.benchmark_media_sorter [records]
+
+Number of records is 1000000 by default.
+"""
+import os
+import random
+import sys
+import time
+
+from tasks.other.media_sorter import media_sorter
+
+
+def make_records(count, seed=0):
+    """Make synthetic records.
+
+    Dates are in 2000-2019 with second resolution, some records have only
+    CreateDate and about 1% of them have the same time as another one.
+
+    :param count: number of records
+    :param seed: seed of random generator
+    :return: list of dictionaries
+    """
+    rand = random.Random(seed)
+    records = []
+    for i in range(count):
+        if records and rand.random() < 0.01:    # burst shot
+            date = records[-1].get('DateTimeOriginal') \
+                or records[-1]['CreateDate']
+        else:
+            date = '{0:04d}:{1:02d}:{2:02d} {3:02d}:{4:02d}:{5:02d}'.format(
+                rand.randint(2000, 2019), rand.randint(1, 12),
+                rand.randint(1, 28), rand.randint(0, 23),
+                rand.randint(0, 59), rand.randint(0, 59))
+        ext = rand.choice(['.jpg', '.mp4', '.mov'])
+        record = {'SourceFile': '/photos/dir{0}/IMG_{1:07d}{2}'.format(
+            i % 100, i, ext)}
+        record['DateTimeOriginal' if ext == '.jpg' else 'CreateDate'] = date
+        records.append(record)
+    return records
+
+
+def run_stages(records):
+    """Time each step of planning for all records.
+
+    :param records: list of dictionaries from make_records
+    :return: list of tuples (name of step, seconds)
+    """
+    helpers = media_sorter.SorterHelpers()
+    index = media_sorter.DuplicateIndex('/sorted')
+    timings = []
+
+    started = time.perf_counter()
+    dates = [helpers.get_date(one) for one in records]
+    timings.append(('get_date', time.perf_counter() - started))
+
+    started = time.perf_counter()
+    parsed = [helpers.parse_date(one) for one in dates]
+    timings.append(('parse_date', time.perf_counter() - started))
+
+    started = time.perf_counter()
+    names = [helpers.format_filename_from_data(one) for one in parsed]
+    timings.append(('format_filename_from_data',
+                    time.perf_counter() - started))
+
+    started = time.perf_counter()
+    paths = [os.path.join('{0}/{1}/{2}'.format(index.root, date.year,
+                                               date.month_txt),
+                          name + os.path.splitext(one['SourceFile'])[-1])
+             for one, date, name in zip(records, parsed, names)]
+    timings.append(('future path', time.perf_counter() - started))
+
+    started = time.perf_counter()
+    for path in paths:
+        # like DuplicateIndex.add, but without size of file on disk
+        index.files[index.relative(index.get_free_path(path))] = None
+    timings.append(('get_free_path', time.perf_counter() - started))
+    return timings
+
+
+def main():
+    """Print time per record of each step."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    records = make_records(count)
+    timings = run_stages(records)
+    total = sum(seconds for _, seconds in timings)
+    for name, seconds in timings + [('total', total)]:
+        print('{0:<28}{1:8.3f} s {2:8.2f} us/file'.format(
+            name, seconds, seconds / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-"""Small media sorter (For Windows only).
+"""Small media sorter.
 
 Will sort files according EXIF creation date and copy files to new directories
 like this:
@@ -17,13 +17,36 @@ like this:
         02_february
             2017-02-01_12-00-00.jpg
             2017-02-02_12-10-00.mp4
+
+Dates of jpg/mp4/mov files are read directly from their headers. Other
+files (and files without dates in headers) are passed to exiftool if it
+is available (bundled exiftool.exe is for Windows only).
+
+Files are renamed if destination is on the same filesystem, otherwise they
+are copied by the kernel and source is removed after the copy is checked.
+
+Python 3.6 or newer is required.
 """
-from collections import namedtuple
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import errno
 import filecmp
+import fnmatch
+import hashlib
+import itertools
 import json
 import os
+import queue
+import re
 import shutil
+import sqlite3
+import struct
 import subprocess
+import sys
+import threading
+import time
 
 
 # START_DIR = 'd:/Dropbox/Camera Uploads'  # from where to take files
@@ -35,7 +58,490 @@ START_DIR = 'd:/YandexDisk/Photos/_foto0'  # from where to take files
 # START_DIR = 'd:/YandexDisk/Photos/_foto2/30_2014_mart moskva'  # from where to take files
 
 DESTINATION_DIR = 'd:/_time_sorted'      # where to put sorted files
-EXTENSIONS = ['jpg', 'mp4', 'mov']       # search only these files
+EXTENSIONS = ['jpg', 'mp4', 'mov']       # search only these files (globs)
+IGNORE = ['ignore_me_dir', '.thumbnails', '@eaDir']  # skip these (globs)
+MAX_DEPTH = None                         # levels of subdirs to search
+
+# http://www.sno.phy.queensu.ca/~phil/exiftool/exiftool_pod.html
+EXIFTOOL_CMD = [os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'exiftool', 'exiftool.exe')]
+EXIFTOOL_BATCH = 100                     # files per one exiftool call
+
+WORKERS = 4                              # threads which copy files
+QUEUE_SIZE = 1000                        # max files waiting between stages
+PROGRESS_INTERVAL = 5                    # seconds between progress lines
+LOG_MODE = 'text'                        # progress as 'text', 'json', 'quiet'
+VERIFY_COPY = 'content'                  # check copies by 'content' or 'size'
+INDEX_FILE = '.media_sorter_index.json'  # hashes of files in DESTINATION_DIR
+MANIFEST_FILE = '.media_sorter.sqlite'   # processed files, in DESTINATION_DIR
+
+
+# Parsed date and path of file
+Date = collections.namedtuple(
+    'Date', ['year', 'month_num', 'month_txt', 'date', 'h', 'm', 's'])
+File = collections.namedtuple('File', ['dir', 'name', 'ext', 'f_path'])
+DATE_MATCH = re.compile(
+    r'(\d{4}):(\d\d):(\d\d) (\d\d):(\d\d):(\d\d)').match
+
+
+class ExifTool(object):
+    """Long-lived exiftool process.
+
+    exiftool is started once with '-stay_open True -@ -' and reads
+    arguments from stdin. Each '-execute' runs one command and its output
+    ends with '{ready}' line.
+    """
+
+    READY = b'{ready}'
+    TAGS = ['-DateTimeOriginal', '-CreateDate']
+
+    def __init__(self, cmd=None, batch_size=None):
+        """Prepare exiftool. It is started on first command.
+
+        :param cmd: list, command to run exiftool. EXIFTOOL_CMD by default.
+        :param batch_size: number of files per one command.
+        """
+        self.cmd = list(cmd or EXIFTOOL_CMD)
+        self.batch_size = batch_size or EXIFTOOL_BATCH
+        self._proc = None
+        self._devnull = None
+        self.available = True
+
+    def __enter__(self):
+        """Use exiftool in with statement (it is started on first command)."""
+        return self
+
+    def __exit__(self, *args):
+        """Close exiftool at the end of with statement."""
+        self.close()
+
+    def start(self):
+        """Start exiftool process."""
+        self._devnull = open(os.devnull, 'wb')
+        self._proc = subprocess.Popen(
+            self.cmd + ['-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._devnull)
+
+    def close(self):
+        """Ask exiftool to exit and wait for it."""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write(b'-stay_open\nFalse\n')
+            self._proc.stdin.close()
+        except IOError:
+            pass  # exiftool has already exited
+        self._proc.wait()
+        self._proc.stdout.close()
+        self._devnull.close()
+        self._proc = None
+
+    def execute(self, *args):
+        """Run one command.
+
+        :param args: arguments of exiftool (one per line).
+        :return: output of command
+        :raise:
+            IOError: If exiftool exited.
+        """
+        for arg in args + ('-execute',):
+            self._proc.stdin.write(arg.encode('utf-8') + b'\n')
+        self._proc.stdin.flush()
+
+        lines = []
+        while True:
+            line = self._proc.stdout.readline()
+            if not line:
+                raise IOError('exiftool exited unexpectedly')
+            if line.rstrip() == self.READY:
+                break
+            lines.append(line)
+        return b''.join(lines).decode('utf-8')
+
+    def get_dates(self, files):
+        """Get dates of files.
+
+        :param files: list of paths to files
+        :return: list of dictionaries (see get_files_with_date).
+                 If exiftool can not be started - files without dates.
+        """
+        if self._proc is None and self.available:
+            try:
+                self.start()
+            except OSError:
+                self.available = False
+                self._devnull.close()
+        if not self.available:
+            return [{'SourceFile': one_file} for one_file in files]
+
+        args = ['-quiet', '-json', '-charset', 'filename=utf8'] + self.TAGS
+        output = self.execute(*(args + list(files))).strip()
+        return json.loads(output) if output else []
+
+    def iter_dates(self, files):
+        """Get dates of files by batches.
+
+        :param files: iterable of paths to files
+        :return: generator of dictionaries (see get_files_with_date)
+        """
+        files = iter(files)
+        while True:
+            batch = list(itertools.islice(files, self.batch_size))
+            if not batch:
+                break
+            for one_file in self.get_dates(batch):
+                yield one_file
+
+
+class DateReader(object):
+    """Read dates of JPEG and MP4/MOV files without exiftool.
+
+    Only headers are read: JPEG APP1 (Exif) segment and QuickTime 'mvhd'
+    atom. Other atoms and JPEG segments are skipped with seek.
+    """
+
+    # Exif IFD pointer in IFD0 and date tags in Exif IFD
+    EXIF_IFD = 0x8769
+    EXIF_TAGS = {0x9003: 'DateTimeOriginal', 0x9004: 'CreateDate'}
+    # Atoms which may be the first atom of QuickTime file
+    QUICKTIME_ATOMS = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide',
+                       b'pnot')
+    QUICKTIME_EPOCH = datetime.datetime(1904, 1, 1)
+
+    @classmethod
+    def read(cls, file_path):
+        """Read dates of file.
+
+        :param file_path: full path to file
+        :return: dictionary like one of get_files_with_date or
+                 None if format is not supported or there are no dates.
+        """
+        readers = {
+            'jpg': cls.read_jpeg,
+            'jpeg': cls.read_jpeg,
+            'mp4': cls.read_quicktime,
+            'mov': cls.read_quicktime,
+            'm4v': cls.read_quicktime,
+        }
+        reader = readers.get(os.path.splitext(file_path)[1][1:].lower())
+        if reader is None:
+            return None
+        try:
+            with open(file_path, 'rb') as f:
+                dates = reader(f)
+        except (IOError, OSError, ValueError, IndexError, struct.error):
+            return None
+        if not dates:
+            return None
+        dates['SourceFile'] = file_path
+        return dates
+
+    @classmethod
+    def read_jpeg(cls, f):
+        """Find Exif segment in JPEG file and read dates from it.
+
+        :param f: file opened in binary mode
+        :return: dictionary with dates or None
+        """
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0:1] != b'\xff':
+                return None
+            code = ord(marker[1:2])
+            if code == 0xff:    # fill byte
+                f.seek(-1, os.SEEK_CUR)
+                continue
+            if code in (0xd9, 0xda):    # end of image, start of scan
+                return None
+            if code == 0x01 or 0xd0 <= code <= 0xd7:    # no length
+                continue
+            length = struct.unpack('>H', f.read(2))[0]
+            if code == 0xe1:
+                data = f.read(length - 2)
+                if data[:6] == b'Exif\x00\x00':
+                    return cls.read_tiff(data[6:])
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
+
+    @classmethod
+    def read_tiff(cls, data):
+        """Read dates from TIFF structure of Exif segment.
+
+        :param data: bytes of TIFF header and IFDs
+        :return: dictionary with dates
+        """
+        order = {b'II': '<', b'MM': '>'}.get(data[:2])
+        if order is None:
+            raise ValueError('Wrong TIFF byte order')
+        ifd0 = struct.unpack(order + 'I', data[4:8])[0]
+        exif_ifd = cls.read_ifd(data, order, ifd0).get(cls.EXIF_IFD)
+        if exif_ifd is None:
+            return {}
+        tags = cls.read_ifd(data, order, exif_ifd)
+        return dict((name, tags[tag]) for tag, name in cls.EXIF_TAGS.items()
+                    if tags.get(tag))
+
+    @classmethod
+    def read_ifd(cls, data, order, offset):
+        """Read ASCII and LONG values of one IFD.
+
+        :param data: bytes of TIFF structure
+        :param order: '<' or '>'
+        :param offset: offset of IFD in data
+        :return: dictionary: tag -> value
+        """
+        count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+        values = {}
+        for start in range(offset + 2, offset + 2 + count * 12, 12):
+            tag, kind, num, value = struct.unpack(
+                order + 'HHI4s', data[start:start + 12])
+            if kind == 2:     # ASCII
+                if num > 4:
+                    value_offset = struct.unpack(order + 'I', value)[0]
+                    value = data[value_offset:value_offset + num]
+                values[tag] = value[:num].rstrip(b'\x00 ').decode(
+                    'ascii', 'replace')
+            elif kind == 4 and num == 1:    # LONG
+                values[tag] = struct.unpack(order + 'I', value)[0]
+        return values
+
+    @classmethod
+    def read_quicktime(cls, f):
+        """Find 'moov/mvhd' atom and read creation date from it.
+
+        :param f: file opened in binary mode
+        :return: dictionary with date or None
+        """
+        end = os.fstat(f.fileno()).st_size
+        f.seek(4)
+        if f.read(4) not in cls.QUICKTIME_ATOMS:
+            return None
+        mvhd = cls.find_atom(f, 0, end, [b'moov', b'mvhd'])
+        if mvhd is None:
+            return None
+
+        f.seek(mvhd)
+        version = ord(f.read(4)[0:1])
+        if version == 1:
+            created = struct.unpack('>Q', f.read(8))[0]
+        else:
+            created = struct.unpack('>I', f.read(4))[0]
+        if not created:
+            return None
+        date = cls.QUICKTIME_EPOCH + datetime.timedelta(seconds=created)
+        return {'CreateDate': '{0:04d}:{1:02d}:{2:02d} {3:02d}:{4:02d}:{5:02d}'
+                .format(date.year, date.month, date.day,
+                        date.hour, date.minute, date.second)}
+
+    @classmethod
+    def find_atom(cls, f, start, end, path):
+        """Find atom by path of types like [b'moov', b'mvhd'].
+
+        :param f: file opened in binary mode
+        :param start: offset where atoms start
+        :param end: offset where atoms end
+        :param path: list of atom types
+        :return: offset of atom content or None
+        """
+        position = start
+        while position + 8 <= end:
+            f.seek(position)
+            size, kind = struct.unpack('>I4s', f.read(8))
+            header = 8
+            if size == 1:    # 64-bit size
+                size = struct.unpack('>Q', f.read(8))[0]
+                header = 16
+            elif size == 0:    # atom lasts to the end
+                size = end - position
+            if size < header:
+                return None
+            if kind == path[0]:
+                if len(path) == 1:
+                    return position + header
+                return cls.find_atom(f, position + header, position + size,
+                                     path[1:])
+            position += size
+        return None
+
+
+class Manifest(object):
+    """Dates and destinations of processed files saved in SQLite.
+
+    Files are identified by path, size and modification time, so dates of
+    a file are read again only if it was changed. Files without dates are
+    remembered too and are not passed to exiftool on every run.
+
+    Connection is shared by threads (calls are serialized by a lock).
+    """
+
+    COMMIT_EVERY = 1000    # changes between commits
+
+    def __init__(self, db_path, readonly=False):
+        """Open (and create if needed) manifest.
+
+        :param db_path: path to SQLite database
+        :param readonly: if True, nothing is saved to manifest
+        """
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+            'dates TEXT, destination TEXT)')
+
+    @classmethod
+    def open(cls, root=None, readonly=False):
+        """Open manifest in destination dir.
+
+        :param root: destination dir, DESTINATION_DIR by default
+        :param readonly: do not create and do not change manifest
+        :return: Manifest or None if readonly and there is no manifest
+        """
+        root = root or DESTINATION_DIR
+        db_path = os.path.join(root, MANIFEST_FILE)
+        if readonly:
+            return cls(db_path, readonly) if os.path.isfile(db_path) else None
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        return cls(db_path)
+
+    def __enter__(self):
+        """Use manifest in with statement."""
+        return self
+
+    def __exit__(self, *args):
+        """Close manifest at the end of with statement."""
+        self.close()
+
+    def close(self):
+        """Commit changes and close database."""
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def get(self, file_path, stat):
+        """Get saved dates of file if it was not changed.
+
+        :param file_path: full path to file
+        :param stat: os.stat result of file
+        :return: dictionary like one of get_files_with_date (without
+                 dates if file has no dates) or None if file is unknown.
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, mtime, dates FROM files WHERE path = ?',
+                (file_path,)).fetchone()
+        if row is None or tuple(row[:2]) != (stat.st_size, stat.st_mtime):
+            return None
+        one_file = json.loads(row[2])
+        one_file['SourceFile'] = file_path
+        return one_file
+
+    def add(self, one_file, stat):
+        """Save dates of file.
+
+        :param one_file: dictionary from get_files_with_date
+        :param stat: os.stat result of file
+        """
+        dates = dict((key, value) for key, value in one_file.items()
+                     if key != 'SourceFile')
+        self._execute(
+            'INSERT OR REPLACE INTO files (path, size, mtime, dates) '
+            'VALUES (?, ?, ?, ?)',
+            (one_file['SourceFile'], stat.st_size, stat.st_mtime,
+             json.dumps(dates)))
+
+    def set_destination(self, file_path, destination):
+        """Save where file was moved (or path of its duplicate).
+
+        :param file_path: full path where file was
+        :param destination: full path where file is now
+        """
+        self._execute('UPDATE files SET destination = ? WHERE path = ?',
+                      (destination, file_path))
+
+    def _execute(self, sql, params):
+        """Run changing query and commit from time to time."""
+        if self.readonly:
+            return
+        with self._lock:
+            self._db.execute(sql, params)
+            self._changes += 1
+            if self._changes >= self.COMMIT_EVERY:
+                self._db.commit()
+                self._changes = 0
+
+
+class Scanner(object):
+    """Find media files with os.scandir.
+
+    Ignored dirs are not entered at all. Files are returned one by one as
+    os.DirEntry, so their stat results are cached (Windows gets them from
+    the directory listing itself).
+    """
+
+    def __init__(self, extensions=None, ignore=None, max_depth=None):
+        """Prepare scanner.
+
+        :param extensions: globs of extensions like 'jpg' or 'jp*g'
+                           (case-insensitive). EXTENSIONS by default.
+        :param ignore: globs of names of dirs and files to skip.
+                       IGNORE by default.
+        :param max_depth: levels of subdirs to search (0 - only root).
+                          MAX_DEPTH by default, None - no limit.
+        """
+        self.extensions = self.compile(
+            EXTENSIONS if extensions is None else extensions)
+        self.ignore = self.compile(IGNORE if ignore is None else ignore)
+        self.max_depth = MAX_DEPTH if max_depth is None else max_depth
+
+    @staticmethod
+    def compile(globs):
+        """Make one regular expression which matches any of globs.
+
+        :param globs: list of shell-style patterns
+        :return: match method of compiled expression
+        """
+        if not globs:
+            return lambda name: None
+        return re.compile('|'.join(fnmatch.translate(one) for one in globs),
+                          re.IGNORECASE).match
+
+    def scan(self, root):
+        """Find files with required extensions in root (recursively).
+
+        Files of a dir are returned before its subdirs, all sorted by name.
+        Dirs which can not be read are skipped.
+
+        :param root: dir to search in
+        :return: generator of os.DirEntry
+        """
+        stack = [(root, 0)]
+        while stack:
+            dir_path, depth = stack.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    entries = sorted(entries, key=lambda one: one.name)
+            except OSError:
+                continue
+
+            sub_dirs = []
+            for entry in entries:
+                if self.ignore(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if self.max_depth is None or depth < self.max_depth:
+                        sub_dirs.append((entry.path, depth + 1))
+                elif self.extensions(os.path.splitext(entry.name)[1][1:]) \
+                        and entry.is_file():
+                    yield entry
+            stack.extend(reversed(sub_dirs))
 
 
 class SorterHelpers(object):
@@ -58,11 +564,18 @@ class SorterHelpers(object):
     }
 
     @staticmethod
-    def get_files_with_date():
-        """Find all files, get time and convert result to jSON.
+    def get_files_with_date(manifest=None):
+        """Find all files, get time from file headers or exiftool.
 
+        Files which DateReader can not read are passed to one long-lived
+        exiftool process by batches, so first files are returned before
+        all files are processed.
+
+        :param manifest: Manifest. If it is given, dates of files which
+                         were not changed since last run are taken from it
+                         and dates of other files are saved to it.
         :return:
-            list if dictionaries.
+            generator of dictionaries.
             Like:
                 [
                 {u'CreateDate': u'2016:04:15 19:53:23',  # May present or not
@@ -77,32 +590,52 @@ class SorterHelpers(object):
         if not os.path.exists(START_DIR):
             raise ValueError('No such directory: %s' % START_DIR)
 
-        # http://www.sno.phy.queensu.ca/~phil/exiftool/exiftool_pod.html
-        cmd = (
-            '{root_dir}/'
-            'exiftool/exiftool.exe '
-            '-quiet -recurse "{media_dir}" '
-            '-ignore "{ignore}" '
-            '-DateTimeOriginal -CreateDate '
-            '-json'.format(
-                root_dir=os.path.dirname(os.path.realpath(__file__)),
-                ignore='ignore_me_dir',  # TODO: Add ignore
-                media_dir=START_DIR))
-        # Add required extensions
-        for ext in EXTENSIONS:
-            cmd += ' -ext %s' % ext
-        print cmd
-
-        # Run tool
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        files_raw = proc.stdout.read().strip()
-        proc.kill()
-        if files_raw:
-            files = json.loads(files_raw)
-            return files
-        else:
+        found = False
+        with ExifTool() as exiftool:
+            unknown = {}
+            for entry in Scanner().scan(START_DIR):
+                found = True
+                file_path = entry.path
+                stat = entry.stat() if manifest else None
+                one_file = manifest and manifest.get(file_path, stat)
+                if one_file:
+                    yield one_file
+                    continue
+                one_file = DateReader.read(file_path)
+                if one_file:
+                    if manifest:
+                        manifest.add(one_file, stat)
+                    yield one_file
+                    continue
+                unknown[file_path] = stat
+                if len(unknown) >= exiftool.batch_size:
+                    for one_file in SorterHelpers._read_with_exiftool(
+                            exiftool, unknown, manifest):
+                        yield one_file
+                    unknown = {}
+            for one_file in SorterHelpers._read_with_exiftool(
+                    exiftool, unknown, manifest):
+                yield one_file
+
+        if not found:
             raise ValueError('No files were found in %s' % START_DIR)
 
+    @staticmethod
+    def _read_with_exiftool(exiftool, files, manifest):
+        """Get dates of files from exiftool and save them to manifest.
+
+        :param exiftool: ExifTool
+        :param files: dictionary: path -> os.stat result
+        :param manifest: Manifest or None
+        :return: generator of dictionaries (see get_files_with_date)
+        """
+        for one_file in exiftool.iter_dates(list(files)):
+            stat = files.get(one_file.get('SourceFile'))
+            # without exiftool files are not checked, so nothing is saved
+            if manifest and stat and exiftool.available:
+                manifest.add(one_file, stat)
+            yield one_file
+
     @staticmethod
     def get_date(one_file_dict):
         """Get date from generated dictionary.
@@ -124,51 +657,42 @@ class SorterHelpers(object):
         """Parse provided date_time and convert in to named tuple.
 
         :param date_time: string like '2017:01:21 12:15:45'
-        :return: named tuple
-        """
-        # pylint: disable=invalid-name
-        date, time = date_time.split()
-        _year = date.split(':')[0]
-        _month_num = date.split(':')[1]
-        _month_txt = '{0}_{1}'.format(_month_num, self.MONTHS[_month_num])
-        _date = date.split(':')[2]
-        _hours = time.split(':')[0]
-        _minutes = time.split(':')[1]
-        _seconds = time.split(':')[2]
-
-        Date = namedtuple(
-            'Date',
-            ['year', 'month_num', 'month_txt', 'date', 'h', 'm', 's'])
-        nt_date = Date(
-            year=_year,
-            month_num=_month_num,
-            month_txt=_month_txt,
-            date=_date,
-            h=_hours,
-            m=_minutes,
-            s=_seconds)
-        return nt_date
+        :return: Date
+        """
+        match = DATE_MATCH(date_time)
+        if match is None:
+            return self._split_date(date_time)
+        year, month_num, date, hours, minutes, seconds = match.groups()
+        return Date(year, month_num, MONTH_DIRS[month_num], date,
+                    hours, minutes, seconds)
+
+    @staticmethod
+    def _split_date(date_time):
+        """Parse date which does not match DATE_MATCH (like '2017:1:2 3:4:5').
+
+        Month and day are padded with zeros, so they are the same as in
+        other dates. Time is kept as it is.
+
+        :param date_time: string like '2017:01:21 12:15:45'
+        :return: Date
+        """
+        date, clock = date_time.split()
+        year, month_num, date = date.split(':')
+        month_num, date = month_num.zfill(2), date.zfill(2)
+        hours, minutes, seconds = clock.split(':')
+        return Date(year, month_num, MONTH_DIRS[month_num], date,
+                    hours, minutes, seconds)
 
     @staticmethod
     def parse_file_path(file_path):
         """Parse and convert str filename to namedtuple.
 
         :param file_path: full path to file
-        :return: named tuple
-        """
-        # pylint: disable=invalid-name
-        _dir = os.path.split(file_path)[0]     # /home/alex/dir/dir
-        _name = os.path.split(file_path)[1]    # 2013-10-04 11:21:39.jpg
-        _name = os.path.splitext(_name)[0]     # 2013-10-04 11:21:39
-        _ext = os.path.splitext(file_path)[1]  # .jpg
-
-        File = namedtuple('File', ['dir', 'name', 'ext', 'f_path'])
-        nt_file = File(
-            dir=_dir,
-            name=_name,
-            ext=_ext,
-            f_path=file_path)
-        return nt_file
+        :return: File
+        """
+        _dir, _name = os.path.split(file_path)   # /home/alex/dir/dir, a.jpg
+        _name, _ext = os.path.splitext(_name)   # 2013-10-04 11:21:39, .jpg
+        return File(dir=_dir, name=_name, ext=_ext, f_path=file_path)
 
     @staticmethod
     def format_filename_from_data(date):
@@ -186,93 +710,794 @@ class SorterHelpers(object):
             s=date.s)
         return file_name
 
+
+class DuplicateIndex(object):
+    """Index of files in destination dir by size and content hash.
+
+    Files are compared by size first, then by hash of their first and last
+    PARTIAL_SIZE bytes and only then by hash of the whole content. Hashes
+    are computed only when they are needed and saved to INDEX_FILE, so
+    next runs do not read destination files again.
+
+    Destination dir is read once: names of files and dirs are kept in
+    memory, so free names are found and dirs are created without asking
+    filesystem again. Paths given by previous add() calls are also known
+    as used names even before files are moved there.
+    """
+
+    PARTIAL_SIZE = 2 ** 16
+
+    def __init__(self, root):
+        """Prepare empty index.
+
+        :param root: destination dir
+        """
+        self.root = root
+        self.files = {}          # relative path -> entry (see load)
+        self.by_size = collections.defaultdict(list)
+        self.dirs = {}           # relative path of existing dir -> st_dev
+        self._counters = {}      # path without counter -> next counter
+        self._prefix = os.path.join(root, '')
+
+    def relative(self, path):
+        """Path relative to root (like os.path.relpath, but faster).
+
+        :param path: full path in root
+        :return: relative path
+        """
+        if path.startswith(self._prefix):
+            rel_path = path[len(self._prefix):]
+            if rel_path == os.path.normpath(rel_path):
+                return rel_path
+        return os.path.relpath(path, self.root)
+
+    @property
+    def index_path(self):
+        """Path to file where index is saved."""
+        return os.path.join(self.root, INDEX_FILE)
+
+    @classmethod
+    def load(cls, root):
+        """Load saved index and update it from files in root.
+
+        Hashes are kept only for files which have the same size and
+        modification time as when they were hashed.
+
+        :param root: destination dir
+        :return: DuplicateIndex
+        """
+        index = cls(root)
+        try:
+            with open(index.index_path) as f:
+                saved = json.load(f)
+        except (IOError, OSError, ValueError):
+            saved = {}
+
+        if os.path.isdir(root):
+            index.dirs[os.curdir] = os.stat(root).st_dev
+        for rel_dir, entries in index._walk():
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) \
+                    if rel_dir != os.curdir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    index.dirs[rel_path] = index.dirs[rel_dir]
+                    continue
+                if rel_path.startswith((INDEX_FILE, MANIFEST_FILE)) \
+                        or rel_path.endswith(Mover.PART):
+                    continue    # files of sorter itself
+                stat = entry.stat()
+                entry = saved.get(rel_path)
+                if entry and entry[:2] == [stat.st_size, stat.st_mtime]:
+                    hashes = entry[2:]
+                else:
+                    hashes = [None, None]
+                index.files[rel_path] = [
+                    stat.st_size, stat.st_mtime, hashes[0], hashes[1], None]
+                index.by_size[stat.st_size].append(rel_path)
+        return index
+
+    def _walk(self):
+        """List all dirs in root with os.scandir (stat results are cached).
+
+        :return: generator of tuples (relative path of dir, list of
+                 os.DirEntry)
+        """
+        stack = [os.curdir] if self.dirs else []
+        while stack:
+            rel_dir = stack.pop()
+            with os.scandir(os.path.join(self.root, rel_dir)) as entries:
+                entries = list(entries)
+            yield rel_dir, entries
+            stack.extend(
+                os.path.normpath(os.path.join(rel_dir, entry.name))
+                for entry in entries if entry.is_dir(follow_symlinks=False))
+
+    def make_dir(self, dir_path):
+        """Create dir (with parents) if it was not created before.
+
+        :param dir_path: full path to dir in destination dir
+        :return: st_dev of dir
+        """
+        rel_dir = self.relative(dir_path)
+        if rel_dir not in self.dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            device = os.stat(dir_path).st_dev
+            parent = rel_dir
+            while parent not in self.dirs:
+                self.dirs[parent] = device
+                parent = os.path.dirname(parent) or os.curdir
+        return self.dirs[rel_dir]
+
+    def save(self):
+        """Save index to INDEX_FILE in root.
+
+        Files which were added but were not moved to their places are
+        dropped.
+        """
+        saved = {}
+        for rel_path, entry in list(self.files.items()):
+            if entry[4] is not None:    # file was added in this run
+                try:
+                    entry[1] = os.stat(os.path.join(self.root,
+                                                    rel_path)).st_mtime
+                except OSError:
+                    self.remove(rel_path)
+                    continue
+                entry[4] = None
+            saved[rel_path] = entry[:4]
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump(saved, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def add(self, f_path, orig_f_path):
+        """Add file which is going to be moved to f_path.
+
+        :param f_path: full path in destination dir
+        :param orig_f_path: current path of file
+        """
+        rel_path = self.relative(f_path)
+        size = os.path.getsize(orig_f_path)
+        self.files[rel_path] = [size, None, None, None, orig_f_path]
+        self.by_size[size].append(rel_path)
+
+    def remove(self, rel_path):
+        """Forget file.
+
+        :param rel_path: path relative to root
+        """
+        entry = self.files.pop(rel_path)
+        self.by_size[entry[0]].remove(rel_path)
+
+    def find_duplicate(self, orig_f_path):
+        """Find file with the same content.
+
+        :param orig_f_path: full path to file
+        :return: full path to file in destination dir or None
+        """
+        size = os.path.getsize(orig_f_path)
+        same_size = self.by_size.get(size)
+        if not same_size:
+            return None
+
+        partial = self.get_hash(orig_f_path, size, full=False)
+        full = None
+        for rel_path in same_size:
+            if self._get_entry_hash(rel_path, full=False) != partial:
+                continue
+            if full is None:
+                full = self.get_hash(orig_f_path, size, full=True)
+            path = os.path.join(self.root, rel_path)
+            if self._get_entry_hash(rel_path, full=True) == full \
+                    and not self._is_same_path(orig_f_path, path):
+                return path
+        return None
+
     @staticmethod
-    def is_the_same_file(file1, file2):
-        """Check if file1 is the same as file2.
-
-        :param file1: full path to file1
-        :param file2: full path to file1
-        :return: True if same file
-                 False if files are different
-        """
-        return filecmp.cmp(file1, file2)
-
-    def change_filename_if_exists(self, orig_f_path, future_f_path):
-        """change filename if both files has the same time."""
-        nt_future_f_path = self.parse_file_path(future_f_path)
-        i = 0
-        while os.path.isfile(future_f_path):
-            if self.is_the_same_file(orig_f_path, future_f_path):
-                os.remove(future_f_path)
+    def _is_same_path(file1, file2):
+        """Check if both paths point to one file (not to equal files)."""
+        try:
+            return os.path.samefile(file1, file2)
+        except OSError:
+            return False
+
+    def get_free_path(self, f_path):
+        """Find name which is not used: f_path, name-1.ext, name-2.ext...
+
+        :param f_path: wanted full path in destination dir
+        :return: full path
+        """
+        rel_path = self.relative(f_path)
+        name, ext = os.path.splitext(rel_path)
+        counter = self._counters.get(rel_path, 0)
+        while True:
+            candidate = '{name}-{counter}{ext}'.format(
+                name=name, counter=counter, ext=ext) if counter else rel_path
+            if candidate not in self.files:
+                break
+            counter += 1
+        self._counters[rel_path] = counter
+        return os.path.join(self.root, candidate)
+
+    def _get_entry_hash(self, rel_path, full):
+        """Get (and remember) hash of indexed file."""
+        entry = self.files[rel_path]
+        position = 3 if full else 2
+        if entry[position] is None:
+            entry[position] = self._hash_entry(rel_path, full)
+        return entry[position]
+
+    def _hash_entry(self, rel_path, full):
+        """Hash content of indexed file where it can be read now.
+
+        Files added in this run are read from their old place until they
+        are moved (source is removed only when file is in its new place).
+        Worker may move file at any moment, then it is read again from
+        its new place.
+        """
+        entry = self.files[rel_path]
+        if entry[4] is not None:
+            try:
+                return self.get_hash(entry[4], entry[0], full)
+            except FileNotFoundError:
+                pass
+        return self.get_hash(os.path.join(self.root, rel_path),
+                             entry[0], full)
+
+    @classmethod
+    def get_hash(cls, file_path, size, full):
+        """Hash of file content.
+
+        :param file_path: full path to file
+        :param size: size of file
+        :param full: hash whole file if True, else only first and last
+                     PARTIAL_SIZE bytes.
+        :return: hex digest
+        """
+        if size <= 2 * cls.PARTIAL_SIZE:
+            full = False    # partial hash covers whole file
+        digest = hashlib.blake2b(digest_size=32)
+        with open(file_path, 'rb') as f:
+            if full:
+                for chunk in iter(lambda: f.read(2 ** 20), b''):
+                    digest.update(chunk)
             else:
-                i += 1
-                future_f_path = '{dir}/{name}-{counter}{ext}'.format(
-                    dir=nt_future_f_path.dir,
-                    name=nt_future_f_path.name,
-                    counter=i,
-                    ext=nt_future_f_path.ext)
-        return future_f_path
+                digest.update(f.read(cls.PARTIAL_SIZE))
+                if size > cls.PARTIAL_SIZE:
+                    f.seek(max(cls.PARTIAL_SIZE, size - cls.PARTIAL_SIZE))
+                    digest.update(f.read(cls.PARTIAL_SIZE))
+        return digest.hexdigest()
+
+
+MONTH_DIRS = dict((num, '{0}_{1}'.format(num, name))
+                  for num, name in SorterHelpers.MONTHS.items())
+
+
+class Progress(object):
+    """Thread-safe counters of processed files.
+
+    Prints one line with counters and throughput every interval seconds
+    instead of a line per file. Lines are text or JSON objects (mode
+    'json'), nothing is printed in mode 'quiet'.
+    """
+
+    def __init__(self, interval=None, output=None, mode=None):
+        """Start counting.
+
+        :param interval: seconds between progress lines
+        :param output: file to print to (stdout by default)
+        :param mode: 'text', 'json' or 'quiet'. LOG_MODE by default.
+        """
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.output = output or sys.stdout
+        self.mode = mode or LOG_MODE
+        self.counts = collections.Counter()
+        self.started = time.time()
+        self._printed = self.started
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        """Increase counter and print progress if it is time to."""
+        with self._lock:
+            self.counts[name] += value
+            now = time.time()
+            if now - self._printed >= self.interval:
+                self._printed = now
+                self.report()
+
+    def report(self):
+        """Print counters and throughput."""
+        if self.mode == 'quiet':
+            return
+        elapsed = max(time.time() - self.started, 1e-6)
+        values = dict(
+            (name, self.counts[name])
+            for name in ('found', 'moved', 'duplicates', 'skipped', 'bytes'))
+        values['rate'] = self.counts['moved'] / elapsed
+        values['mb_rate'] = self.counts['bytes'] / elapsed / 2 ** 20
+        if self.mode == 'json':
+            values['elapsed'] = elapsed
+            self.output.write(json.dumps(values, sort_keys=True) + '\n')
+        else:
+            self.output.write(
+                '{found} found, {moved} moved, {duplicates} duplicates, '
+                '{skipped} without date | {rate:.1f} files/s, '
+                '{mb_rate:.1f} MB/s\n'.format(**values))
+        self.output.flush()
+
+
+class Mover(object):
+    """Move files as cheap as possible.
+
+    On the same filesystem file is renamed. Otherwise data is copied by the
+    kernel (copy_file_range or sendfile) if it is possible, copy is checked
+    (VERIFY_COPY) and only then source is removed. Timestamps are kept.
+    """
+
+    COPY_CHUNK = 2 ** 30    # bytes per one kernel call
+    VERIFY_CHUNK = 2 ** 20  # bytes read at once to compare copy
+    PART = '.part'          # suffix of file while it is copied
+    # errors meaning that kernel can not copy these files this way
+    UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                   errno.ENOTSUP, errno.EBADF)
+
+    @classmethod
+    def move(cls, orig_f_path, future_f_path, device=None):
+        """Move file. Directory of future_f_path must exist.
+
+        :param orig_f_path: full path to file
+        :param future_f_path: new path, it must not exist
+        :param device: st_dev of directory of future_f_path if it is known
+        :return: number of copied bytes (0 if file was renamed)
+        :raise:
+            IOError: If copy is not the same as source.
+        """
+        if device is None:
+            device = os.stat(os.path.dirname(future_f_path) or '.').st_dev
+        if os.stat(orig_f_path).st_dev == device:
+            if os.path.lexists(future_f_path):
+                raise OSError(errno.EEXIST, 'File exists', future_f_path)
+            try:
+                os.rename(orig_f_path, future_f_path)
+                return 0
+            except OSError as error:
+                if error.errno != errno.EXDEV:    # e.g. bind mounts
+                    raise
+        return cls.copy_and_remove(orig_f_path, future_f_path)
+
+    @classmethod
+    def copy_and_remove(cls, orig_f_path, future_f_path):
+        """Copy file with its timestamps, check copy and remove source.
+
+        File is copied to future_f_path + PART and renamed when it is
+        checked, so future_f_path is never a half-copied file (even if
+        process is killed). PART file is created exclusively, so a copy
+        of another running sorter is never overwritten.
+
+        :return: number of copied bytes
+        :raise:
+            FileExistsError: If PART file exists (other sorter copies
+                             this file now or was killed during copying).
+        """
+        part_f_path = future_f_path + cls.PART
+        with open(orig_f_path, 'rb') as fsrc:
+            fdst = open(part_f_path, 'xb')
+            try:
+                with fdst:
+                    size = cls.copy_data(fsrc, fdst)
+                    fdst.flush()
+                    os.fsync(fdst.fileno())
+                cls.verify(orig_f_path, part_f_path)
+                shutil.copystat(orig_f_path, part_f_path)
+                if os.path.lexists(future_f_path):
+                    raise OSError(errno.EEXIST, 'File exists', future_f_path)
+                os.replace(part_f_path, future_f_path)
+            except BaseException:
+                os.remove(part_f_path)
+                raise
+        os.remove(orig_f_path)
+        return size
+
+    @classmethod
+    def copy_data(cls, fsrc, fdst):
+        """Copy content of one file to another.
+
+        Kernel-side copying is tried first, Python buffers are used only if
+        kernel can not copy these files.
+
+        :param fsrc: source file opened in binary mode
+        :param fdst: new empty file opened in binary mode
+        :return: number of copied bytes
+        """
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        for copy_range in (cls._copy_file_range, cls._sendfile):
+            if offset >= size:
+                break
+            offset = copy_range(fsrc.fileno(), fdst.fileno(), offset, size)
+        if offset < size:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            shutil.copyfileobj(fsrc, fdst, 2 ** 20)
+        return size
+
+    @classmethod
+    def _copy_file_range(cls, src, dst, offset, size):
+        """Copy with copy_file_range (Linux, may make reflink).
+
+        :return: offset where copying stopped
+        """
+        if not hasattr(os, 'copy_file_range'):
+            return offset
+        try:
+            while offset < size:
+                copied = os.copy_file_range(
+                    src, dst, min(cls.COPY_CHUNK, size - offset),
+                    offset, offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError as error:
+            if error.errno not in cls.UNSUPPORTED:
+                raise
+        return offset
+
+    @classmethod
+    def _sendfile(cls, src, dst, offset, size):
+        """Copy with sendfile (Linux can send file to file).
+
+        :return: offset where copying stopped
+        """
+        if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+            return offset
+        os.lseek(dst, offset, os.SEEK_SET)
+        try:
+            while offset < size:
+                copied = os.sendfile(dst, src, offset,
+                                     min(cls.COPY_CHUNK, size - offset))
+                if not copied:
+                    break
+                offset += copied
+        except OSError as error:
+            if error.errno not in cls.UNSUPPORTED:
+                raise
+        return offset
+
+    @classmethod
+    def verify(cls, orig_f_path, future_f_path):
+        """Check that copy is the same as source.
+
+        Only copies between filesystems are checked, so by default content
+        is compared: source is removed after it and size alone does not
+        show broken data. 'size' is only for slow media where reading the
+        files again costs too much.
+
+        :raise:
+            IOError: If sizes (or content if VERIFY_COPY is 'content')
+                     of files are different.
+        """
+        same = os.path.getsize(orig_f_path) == os.path.getsize(future_f_path)
+        if same and VERIFY_COPY == 'content':
+            same = cls.same_content(orig_f_path, future_f_path)
+        if not same:
+            raise IOError('Copy of {0} is broken: {1}'.format(
+                orig_f_path, future_f_path))
+
+    @classmethod
+    def same_content(cls, f_path, other_f_path):
+        """Compare files block by block, stop on the first difference.
+
+        :return: True if content of files is the same
+        """
+        with open(f_path, 'rb') as f, open(other_f_path, 'rb') as other:
+            while True:
+                block = f.read(cls.VERIFY_CHUNK)
+                if block != other.read(cls.VERIFY_CHUNK):
+                    return False
+                if not block:
+                    return True
 
 
 class Sorter(SorterHelpers):
-    """Sorting tool mail logic."""
+    """Sorting tool mail logic.
 
-    def run(self):
-        """Run media sorter."""
-        files = self.get_files_with_date()
+    Files go through three stages:
+        - dates are read in a separate thread,
+        - destination of each file is planned in the main thread one by
+          one, so names are deterministic and never collide,
+        - files are copied by a pool of threads.
+    """
 
-        for one_file in files:
-            exif_date = self.get_date(one_file)
+    _DONE = object()
 
-            orig_f_path = one_file.get('SourceFile', None)
-            print('\n{0}'.format(orig_f_path))
+    def __init__(self, workers=None, log_mode=None):
+        """Prepare sorter.
+
+        :param workers: number of threads which move files.
+        :param log_mode: 'text', 'json' or 'quiet' (see Progress)
+        """
+        self.workers = workers or WORKERS
+        self.log_mode = log_mode
+        self.progress = None
+        self.index = None
+        self.manifest = None
 
-            if exif_date:
+    def plan_move(self, one_file):
+        """Choose new path for a file.
 
-                date = self.parse_date(exif_date)
-                future_dir = '{dir}/{year}/{month}'.format(
-                    dir=DESTINATION_DIR,
-                    year=date.year,
-                    month=date.month_txt)
-                future_name = '{name}{ext}'.format(
-                    name=self.format_filename_from_data(date),
-                    ext=os.path.splitext(orig_f_path)[-1])
+        :param one_file: dictionary from get_files_with_date
+        :return: tuple (orig_f_path, future_f_path, is_duplicate) or
+                 None if file has no date.
+        """
+        exif_date = self.get_date(one_file)
+        orig_f_path = one_file.get('SourceFile', None)
+        if not exif_date:
+            # do nothing with files with no EXIF data
+            return None
 
-                if not os.path.exists(future_dir):
-                    os.makedirs(future_dir)
-                future_f_path = os.path.join(future_dir, future_name)
+        date = self.parse_date(exif_date)
+        future_dir = '{dir}/{year}/{month}'.format(
+            dir=DESTINATION_DIR,
+            year=date.year,
+            month=date.month_txt)
+        future_name = '{name}{ext}'.format(
+            name=self.format_filename_from_data(date),
+            ext=os.path.splitext(orig_f_path)[-1])
+        future_f_path = os.path.join(future_dir, future_name)
 
-                # Change filename if both files has the same time
-                future_f_path = self.change_filename_if_exists(
-                    orig_f_path, future_f_path)
+        # Change filename if both files has the same time
+        future_f_path, is_duplicate = self.get_free_filename(
+            orig_f_path, future_f_path)
+        return orig_f_path, future_f_path, is_duplicate
 
-                # Move file to a new place
-                shutil.copyfile(orig_f_path, future_f_path)
-                os.remove(orig_f_path)
-                # pylint: disable=superfluous-parens
-                print('{0}\n  -> {1}'.format(orig_f_path, future_f_path))
+    def get_free_filename(self, orig_f_path, future_f_path):
+        """Find name which is not used in destination and not planned before.
+
+        :return: tuple (future_f_path, is_duplicate). is_duplicate is True
+                 if the same file is already in destination (or is planned
+                 to be there), future_f_path is path of that file then.
+        """
+        duplicate = self.index.find_duplicate(orig_f_path)
+        if duplicate is not None:
+            return duplicate, True
+        future_f_path = self.index.get_free_path(future_f_path)
+        self.index.add(future_f_path, orig_f_path)
+        return future_f_path, False
+
+    def move(self, orig_f_path, future_f_path, is_duplicate, device=None):
+        """Move file to a new place (or remove it if it is a duplicate).
+
+        Dir of future_f_path must exist. device is its st_dev if known.
+        """
+        if is_duplicate:
+            os.remove(orig_f_path)
+            self.manifest.set_destination(orig_f_path, future_f_path)
+            self.progress.add('duplicates')
+            return
+
+        self.progress.add('bytes', Mover.move(orig_f_path, future_f_path,
+                                              device))
+        self.manifest.set_destination(orig_f_path, future_f_path)
+        self.progress.add('moved')
+
+    def make_plan(self):
+        """Plan moves of all files without changing anything on disk.
+
+        Files are only read: dates, hashes of possible duplicates and names
+        in destination dir. Manifest is used if it exists.
+
+        :return: generator of tuples (orig_f_path, future_f_path,
+                 is_duplicate). Files without dates are not included.
+        """
+        self.index = DuplicateIndex.load(DESTINATION_DIR)
+        manifest = Manifest.open(readonly=True)
+        try:
+            for one_file in self.get_files_with_date(manifest):
+                planned = self.plan_move(one_file)
+                if planned is not None:
+                    yield planned
+        finally:
+            if manifest:
+                manifest.close()
+
+    def write_plan(self, plan_path):
+        """Save plan of moves to file (one JSON object per line).
+
+        :param plan_path: path to plan file
+        :return: number of planned moves
+        """
+        count = 0
+        with open(plan_path + '.tmp', 'w') as plan:
+            plan.write(json.dumps({'start_dir': START_DIR,
+                                   'destination_dir': DESTINATION_DIR}) + '\n')
+            for orig_f_path, future_f_path, is_duplicate in self.make_plan():
+                plan.write(json.dumps({'source': orig_f_path,
+                                       'destination': future_f_path,
+                                       'duplicate': is_duplicate}) + '\n')
+                count += 1
+        os.replace(plan_path + '.tmp', plan_path)
+        return count
+
+    @staticmethod
+    def read_plan(plan_path):
+        """Read plan saved by write_plan.
+
+        :param plan_path: path to plan file
+        :return: list of tuples (step number, orig_f_path, future_f_path,
+                 is_duplicate)
+        """
+        steps = []
+        with open(plan_path) as plan:
+            next(plan)    # header
+            for number, line in enumerate(plan):
+                step = json.loads(line)
+                steps.append((number, step['source'], step['destination'],
+                              step['duplicate']))
+        return steps
+
+    def apply(self, plan_path):
+        """Move files as planned by write_plan.
+
+        Numbers of finished steps are appended to plan_path + '.done', so
+        if apply is interrupted, next call continues from there. Steps
+        which were done but were not written there are recognized by
+        files (see apply_step). All dirs are created before moves.
+
+        :param plan_path: path to plan file
+        """
+        done_path = plan_path + '.done'
+        done = set()
+        if os.path.exists(done_path):
+            with open(done_path) as done_file:
+                done = set(int(line) for line in done_file if line.strip())
+        steps = [step for step in self.read_plan(plan_path)
+                 if step[0] not in done]
+
+        devices = {}
+        for dir_path in sorted(set(os.path.dirname(step[2])
+                                   for step in steps if not step[3])):
+            os.makedirs(dir_path, exist_ok=True)
+            devices[dir_path] = os.stat(dir_path).st_dev
+
+        self.progress = Progress(mode=self.log_mode)
+        self.manifest = Manifest.open()
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(QUEUE_SIZE)
+
+        def finish(number, future):
+            in_flight.release()
+            if future.exception() is None:
+                with lock:
+                    done_file.write('{0}\n'.format(number))
+                    done_file.flush()
+
+        pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        try:
+            with open(done_path, 'a') as done_file, pool:
+                # duplicates are removed only when their files are in place
+                for is_duplicate in (False, True):
+                    futures = []
+                    for step in steps:
+                        if step[3] != is_duplicate:
+                            continue
+                        in_flight.acquire()
+                        future = pool.submit(
+                            self.apply_step, step[1], step[2], step[3],
+                            devices.get(os.path.dirname(step[2])))
+                        future.add_done_callback(
+                            lambda one, number=step[0]: finish(number, one))
+                        futures.append(future)
+                    for future in futures:
+                        future.result()
+        finally:
+            self.manifest.close()
+        self.progress.report()
+
+    def apply_step(self, orig_f_path, future_f_path, is_duplicate,
+                   device=None):
+        """Do one step of plan if it was not done before.
+
+        Plan may be old, so duplicates are removed only if the same file
+        is in destination now.
+
+        :raise:
+            IOError: If source is missing and file is not in destination or
+                     another file is in destination.
+        """
+        if not os.path.exists(orig_f_path):
+            if is_duplicate or os.path.exists(future_f_path):
+                return    # done before
+            raise IOError('File is missing: {0}'.format(orig_f_path))
+        if is_duplicate or os.path.exists(future_f_path):
+            # duplicate or moved, but interrupted before source was removed
+            if not os.path.exists(future_f_path) or not filecmp.cmp(
+                    orig_f_path, future_f_path, shallow=False):
+                raise IOError('Another file is in {0}'.format(future_f_path))
+            is_duplicate = True
+        self.move(orig_f_path, future_f_path, is_duplicate, device)
+
+    def _read_dates(self, files_queue):
+        """Put dates of all files to queue (runs in a separate thread)."""
+        try:
+            for one_file in self.get_files_with_date(self.manifest):
+                files_queue.put(one_file)
+        except Exception as error:  # pylint: disable=broad-except
+            files_queue.put(error)
+        files_queue.put(self._DONE)
+
+    def run(self):
+        """Run media sorter."""
+        self.progress = Progress(mode=self.log_mode)
+        self.manifest = Manifest.open()
+        self.index = DuplicateIndex.load(DESTINATION_DIR)
+        files_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        reader = threading.Thread(target=self._read_dates,
+                                  args=(files_queue,))
+        reader.daemon = True
+        reader.start()
+
+        in_flight = threading.BoundedSemaphore(QUEUE_SIZE)
+        futures = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+                for one_file in iter(files_queue.get, self._DONE):
+                    if isinstance(one_file, Exception):
+                        raise one_file
+                    self.progress.add('found')
+
+                    planned = self.plan_move(one_file)
+                    if planned is None:
+                        self.progress.add('skipped')
+                        continue
+
+                    orig_f_path, future_f_path, is_duplicate = planned
+                    device = None
+                    if not is_duplicate:
+                        device = self.index.make_dir(
+                            os.path.dirname(future_f_path))
+
+                    in_flight.acquire()
+                    future = pool.submit(self.move, orig_f_path,
+                                         future_f_path, is_duplicate, device)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+                for future in futures:
+                    future.result()
+        finally:
+            self.index.save()
+            self.manifest.close()
+
+        reader.join()
+        self.progress.report()
 
-            else:
-                # do nothing with files with no EXIF data
-                pass
-                '''
-                # if we do not have date in EXIF
-                future_dir = '{dir}/no_exif'.format(
-                    dir=DESTINATION_DIR)
-                future_name = os.path.split(orig_f_path)[1]
-                if not os.path.exists(future_dir):
-                    os.makedirs(future_dir)
-                future_f_path = os.path.join(future_dir, future_name)
 
-                # Change filename if both files has the same time
-                future_f_path = self.change_filename_if_exists(
-                    orig_f_path, future_f_path)
+def main():
+    """Sort files, or only plan moves, or move files as planned."""
+    parser = argparse.ArgumentParser(description='Sort media files by date.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--plan', metavar='FILE',
+                       help='only save plan of moves to FILE (dry run)')
+    group.add_argument('--apply', metavar='FILE',
+                       help='move files as planned in FILE '
+                            '(continues if it was interrupted)')
+    parser.add_argument('--log', choices=['text', 'json', 'quiet'],
+                        default=LOG_MODE,
+                        help='format of progress lines (default: %(default)s)')
+    args = parser.parse_args()
 
-                # Copy file to a new place
-                shutil.copyfile(orig_f_path, future_f_path)
-                '''
+    sorter = Sorter(log_mode=args.log)
+    if args.plan:
+        count = sorter.write_plan(args.plan)
+        if args.log == 'json':
+            print(json.dumps({'planned': count, 'plan': args.plan}))
+        elif args.log == 'text':
+            print('{0} moves are planned in {1}'.format(count, args.plan))
+    elif args.apply:
+        sorter.apply(args.apply)
+    else:
+        sorter.run()
 
 
 if __name__ == "__main__":
-    SORTER = Sorter()
-    SORTER.run()
+    main()
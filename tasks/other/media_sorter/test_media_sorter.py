@@ -0,0 +1,603 @@
+#!/usr/bin/env python
+"""Tests of media sorter with a local stand-in for exiftool."""
+
+import datetime
+import errno
+import io
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+
+import pytest
+
+from tasks.other.media_sorter import media_sorter
+
+
+# Reads commands like exiftool -stay_open does. Date of file is taken from
+# the file content. Number of files in each command is written to log file.
+FAKE_EXIFTOOL = r'''
+import json
+import re
+import sys
+
+log_path = sys.argv[1]
+args = []
+for line in iter(sys.stdin.readline, ''):
+    arg = line.rstrip('\n')
+    if args[-1:] == ['-stay_open'] and arg == 'False':
+        break
+    if arg != '-execute':
+        args.append(arg)
+        continue
+
+    files = [one for prev, one in zip([''] + args, args)
+             if not one.startswith('-') and prev != '-charset']
+    records = []
+    for path in files:
+        record = {'SourceFile': path}
+        with open(path) as f:
+            found = re.search(r'\d{4}:\d\d:\d\d \d\d:\d\d:\d\d', f.read())
+        if found:
+            record['DateTimeOriginal'] = found.group(0)
+        records.append(record)
+    with open(log_path, 'a') as log:
+        log.write('%d\n' % len(files))
+    if records:
+        sys.stdout.write(json.dumps(records) + '\n')
+    sys.stdout.write('{ready}\n')
+    sys.stdout.flush()
+    args = []
+'''
+
+
+def make_jpeg(date):
+    """Make smallest JPEG with DateTimeOriginal in Exif (big-endian TIFF)."""
+    date = date.encode('ascii') + b'\x00'
+    exif_ifd = 8 + 18
+    tiff = b''.join([
+        b'MM\x00\x2a', struct.pack('>I', 8),
+        struct.pack('>HHHII', 1, 0x8769, 4, 1, exif_ifd), b'\x00' * 4,
+        struct.pack('>HHHII', 1, 0x9003, 2, len(date), exif_ifd + 18),
+        b'\x00' * 4, date])
+    app0 = b'JFIF\x00' + b'\x00' * 9
+    app1 = b'Exif\x00\x00' + tiff
+    return b''.join([
+        b'\xff\xd8',
+        b'\xff\xe0', struct.pack('>H', len(app0) + 2), app0,
+        b'\xff\xe1', struct.pack('>H', len(app1) + 2), app1,
+        b'\xff\xda', b'\x00' * 10, b'\xff\xd9'])
+
+
+def make_mp4(date):
+    """Make smallest MP4 with creation date in 'moov/mvhd' atom."""
+    created = datetime.datetime.strptime(date, '%Y:%m:%d %H:%M:%S')
+    seconds = int((created - datetime.datetime(1904, 1, 1)).total_seconds())
+
+    def atom(kind, content):
+        return struct.pack('>I4s', len(content) + 8, kind) + content
+
+    mvhd = atom(b'mvhd', b''.join([
+        b'\x00' * 4, struct.pack('>II', seconds, seconds), b'\x00' * 92]))
+    return b''.join([atom(b'ftyp', b'isom\x00\x00\x02\x00'),
+                     atom(b'mdat', b'\x00' * 100),
+                     atom(b'moov', atom(b'udta', b'') + mvhd)])
+
+
+@pytest.fixture
+def sorter_env(tmpdir, monkeypatch):
+    """Start and destination dirs with fake exiftool configured."""
+    start_dir = tmpdir.mkdir('start')
+    destination_dir = tmpdir.mkdir('sorted')
+    fake_exiftool = tmpdir.join('fake_exiftool.py')
+    fake_exiftool.write(FAKE_EXIFTOOL)
+    log = tmpdir.join('exiftool.log')
+
+    monkeypatch.setattr(media_sorter, 'START_DIR', str(start_dir))
+    monkeypatch.setattr(media_sorter, 'DESTINATION_DIR', str(destination_dir))
+    monkeypatch.setattr(media_sorter, 'EXIFTOOL_CMD',
+                        [sys.executable, str(fake_exiftool), str(log)])
+    monkeypatch.setattr(media_sorter, 'EXIFTOOL_BATCH', 2)
+    return {'start': start_dir, 'destination': destination_dir, 'log': log}
+
+
+class TestSorter(object):
+    """Test Sorter with fake exiftool."""
+
+    def test_files_are_read_by_batches(self, sorter_env):
+        """Files with required extensions are passed to exiftool by batches."""
+        for i in range(5):
+            sorter_env['start'].join('%d.jpg' % i).write(
+                '2016:04:1%d 19:53:23' % i)
+        sorter_env['start'].join('skip.txt').write('2016:04:10 19:53:23')
+
+        files = list(media_sorter.SorterHelpers.get_files_with_date())
+
+        assert [os.path.basename(one['SourceFile']) for one in files] == [
+            '0.jpg', '1.jpg', '2.jpg', '3.jpg', '4.jpg']
+        assert files[3]['DateTimeOriginal'] == '2016:04:13 19:53:23'
+        assert sorter_env['log'].read().split() == ['2', '2', '1']
+
+    def test_first_file_is_returned_before_others_are_read(self, sorter_env):
+        """First files are returned before next batch is sent."""
+        for i in range(5):
+            sorter_env['start'].join('%d.jpg' % i).write('no date')
+
+        files = media_sorter.SorterHelpers.get_files_with_date()
+        next(files)
+        assert sorter_env['log'].read().split() == ['2']
+        files.close()
+
+    def test_no_files(self, sorter_env):
+        """Error is raised if there are no files."""
+        with pytest.raises(ValueError):
+            list(media_sorter.SorterHelpers.get_files_with_date())
+
+    def test_run(self, sorter_env):
+        """Files are moved to year/month dirs and renamed."""
+        start = sorter_env['start']
+        start.mkdir('sub').join('a.jpg').write('2016:04:15 19:53:23 a')
+        start.join('b.jpg').write('2016:04:15 19:53:23 b')
+        start.join('c.mov').write('2017:01:02 10:00:00')
+        start.join('no_date.jpg').write('nothing')
+        start.mkdir('ignore_me_dir').join('d.jpg').write(
+            '2017:01:02 10:00:00')
+
+        media_sorter.Sorter().run()
+
+        destination = sorter_env['destination']
+        assert sorted(os.listdir(str(destination.join('2016', '04_april')))) \
+            == ['2016-04-15_19-53-23-1.jpg', '2016-04-15_19-53-23.jpg']
+        assert os.listdir(str(destination.join('2017', '01_january'))) == [
+            '2017-01-02_10-00-00.mov']
+        assert start.join('no_date.jpg').check()
+        assert start.join('ignore_me_dir', 'd.jpg').check()
+        assert not start.join('b.jpg').check()
+
+    def test_run_with_many_workers(self, sorter_env):
+        """Names of files with the same time depend only on their order."""
+        start = sorter_env['start']
+        for i in range(20):
+            start.join('%02d.jpg' % i).write_binary(
+                make_jpeg('2016:04:15 19:53:23') + str(i).encode('ascii'))
+        existing = make_jpeg('2016:04:15 19:53:23')
+        sorter_env['destination'].mkdir('2016').mkdir('04_april').join(
+            '2016-04-15_19-53-23.jpg').write_binary(existing)
+        start.join('dup.jpg').write_binary(existing)
+
+        media_sorter.Sorter(workers=4).run()
+
+        month = sorter_env['destination'].join('2016', '04_april')
+        for i in range(20):
+            name = '2016-04-15_19-53-23-%d.jpg' % (i + 1)
+            assert month.join(name).read_binary().endswith(
+                str(i).encode('ascii'))
+        assert not start.listdir()
+
+    def test_duplicates_in_one_run(self, sorter_env):
+        """Second copy of a file is removed, not moved."""
+        start = sorter_env['start']
+        start.join('a.jpg').write('2016:04:15 19:53:23')
+        start.join('b.jpg').write('2016:04:15 19:53:23')
+        start.join('c.jpg').write('2016:04:15 19:53:23!')
+
+        media_sorter.Sorter().run()
+
+        month = sorter_env['destination'].join('2016', '04_april')
+        assert sorted(os.listdir(str(month))) == [
+            '2016-04-15_19-53-23-1.jpg', '2016-04-15_19-53-23.jpg']
+        assert not start.listdir()
+
+    def test_second_run(self, sorter_env):
+        """Files without dates are passed to exiftool only once."""
+        start = sorter_env['start']
+        start.join('a.jpg').write('no date')
+        start.join('b.jpg').write('2016:04:15 19:53:23')
+
+        media_sorter.Sorter().run()
+        start.join('b.jpg').write('2016:04:15 19:53:23')
+        media_sorter.Sorter().run()
+        assert sorter_env['log'].read().split() == ['2', '1']
+
+        start.join('a.jpg').write('2017:01:02 10:00:00 and now with date')
+        os.utime(str(start.join('a.jpg')), (1000000000, 1000000000))
+        media_sorter.Sorter().run()
+        assert sorter_env['log'].read().split() == ['2', '1', '1']
+        assert not start.listdir()
+
+        db = sqlite3.connect(str(sorter_env['destination'].join(
+            media_sorter.MANIFEST_FILE)))
+        assert dict(db.execute('SELECT path, destination FROM files')) == {
+            str(start.join('a.jpg')): str(sorter_env['destination'].join(
+                '2017', '01_january', '2017-01-02_10-00-00.jpg')),
+            str(start.join('b.jpg')): str(sorter_env['destination'].join(
+                '2016', '04_april', '2016-04-15_19-53-23.jpg'))}
+        db.close()
+
+
+class TestPlan(object):
+    """Test planning of moves and applying of plans."""
+
+    @pytest.fixture
+    def plan(self, sorter_env):
+        """Plan for three files (one of them is a duplicate)."""
+        start = sorter_env['start']
+        start.join('a.jpg').write('2016:04:15 19:53:23 a')
+        start.join('b.jpg').write('2016:04:15 19:53:23 b')
+        start.join('c.jpg').write('2016:04:15 19:53:23 a')
+        start.join('d.jpg').write('no date')
+        plan = sorter_env['start'].dirpath().join('plan.jsonl')
+        assert media_sorter.Sorter().write_plan(str(plan)) == 3
+        return plan
+
+    def test_plan(self, sorter_env, plan):
+        """Nothing is changed by planning."""
+        month = sorter_env['destination'].join('2016', '04_april')
+        assert [step[1:] for step in media_sorter.Sorter.read_plan(
+            str(plan))] == [
+                (str(sorter_env['start'].join('a.jpg')),
+                 str(month.join('2016-04-15_19-53-23.jpg')), False),
+                (str(sorter_env['start'].join('b.jpg')),
+                 str(month.join('2016-04-15_19-53-23-1.jpg')), False),
+                (str(sorter_env['start'].join('c.jpg')),
+                 str(month.join('2016-04-15_19-53-23.jpg')), True)]
+        assert len(sorter_env['start'].listdir()) == 4
+        assert not sorter_env['destination'].listdir()
+
+    def test_apply(self, sorter_env, plan):
+        """Files are moved as planned."""
+        media_sorter.Sorter().apply(str(plan))
+
+        month = sorter_env['destination'].join('2016', '04_april')
+        assert month.join('2016-04-15_19-53-23-1.jpg').read() \
+            == '2016:04:15 19:53:23 b'
+        assert sorted(os.listdir(str(sorter_env['start']))) == ['d.jpg']
+        assert sorted(plan.new(ext='jsonl.done').read().split()) \
+            == ['0', '1', '2']
+
+    def test_resume(self, sorter_env, plan):
+        """Interrupted apply is continued."""
+        steps = media_sorter.Sorter.read_plan(str(plan))
+        os.makedirs(os.path.dirname(steps[0][2]))
+        os.rename(steps[0][1], steps[0][2])     # moved
+        shutil.copyfile(steps[1][1], steps[1][2])   # copied, not removed
+        plan.new(ext='jsonl.done').write('2\n')     # done, but kept
+
+        media_sorter.Sorter().apply(str(plan))
+
+        assert sorted(os.listdir(str(sorter_env['start']))) == [
+            'c.jpg', 'd.jpg']
+        assert open(steps[1][2]).read() == '2016:04:15 19:53:23 b'
+        assert sorted(plan.new(ext='jsonl.done').read().split()) \
+            == ['0', '1', '2']
+
+    def test_conflict(self, sorter_env, plan):
+        """Files are never moved over other files."""
+        steps = media_sorter.Sorter.read_plan(str(plan))
+        os.makedirs(os.path.dirname(steps[0][2]))
+        with open(steps[0][2], 'w') as other:
+            other.write('other')
+
+        with pytest.raises(IOError):
+            media_sorter.Sorter().apply(str(plan))
+        assert open(steps[0][2]).read() == 'other'
+        assert sorter_env['start'].join('a.jpg').check()
+        assert sorter_env['start'].join('c.jpg').check()
+        assert plan.new(ext='jsonl.done').read().split() == ['1']
+
+
+class TestHelpers(object):
+    """Test parsing of dates and progress lines."""
+
+    def test_parse_date(self):
+        """Dates with time zones and without leading zeros are parsed."""
+        helpers = media_sorter.SorterHelpers()
+        expected = media_sorter.Date(
+            '2017', '01', '01_january', '02', '10', '00', '05')
+        assert helpers.parse_date('2017:01:02 10:00:05') == expected
+        assert helpers.parse_date('2017:01:02 10:00:05+03:00') == expected
+        assert helpers.parse_date('2017:01:02 7:00:05').h == '7'
+        assert helpers.parse_date('2017:1:2 3:4:5') == media_sorter.Date(
+            '2017', '01', '01_january', '02', '3', '4', '5')
+
+    def test_progress_modes(self):
+        """Progress is printed as JSON or not printed at all."""
+        output = io.StringIO()
+        progress = media_sorter.Progress(output=output, mode='json')
+        progress.add('found', 3)
+        progress.add('moved')
+        progress.report()
+        line = json.loads(output.getvalue())
+        assert (line['found'], line['moved'], line['skipped']) == (3, 1, 0)
+
+        output = io.StringIO()
+        progress = media_sorter.Progress(interval=0, output=output,
+                                         mode='quiet')
+        progress.add('found')
+        progress.report()
+        assert output.getvalue() == ''
+
+
+class TestScanner(object):
+    """Test search of media files."""
+
+    def test_scan(self, tmpdir):
+        """Ignored dirs and dirs deeper than max depth are skipped."""
+        tmpdir.join('b.JPG').write('')
+        tmpdir.join('a.jpeg').write('')
+        tmpdir.join('c.txt').write('')
+        tmpdir.mkdir('sub').join('d.mp4').write('')
+        tmpdir.join('sub').mkdir('deep').join('e.jpg').write('')
+        tmpdir.mkdir('.thumbnails').join('f.jpg').write('')
+
+        scanner = media_sorter.Scanner(extensions=['jp*g', 'mp4'],
+                                       ignore=['.thumb*'], max_depth=1)
+        found = [os.path.relpath(entry.path, str(tmpdir))
+                 for entry in scanner.scan(str(tmpdir))]
+
+        assert found == ['a.jpeg', 'b.JPG', os.path.join('sub', 'd.mp4')]
+        assert [os.path.relpath(entry.path, str(tmpdir)) for entry in
+                media_sorter.Scanner(['jpg']).scan(str(tmpdir))] == [
+            'b.JPG', os.path.join('sub', 'deep', 'e.jpg')]
+
+
+class TestDuplicateIndex(object):
+    """Test index of destination files."""
+
+    @pytest.fixture
+    def hashed(self, monkeypatch):
+        """List of files which were hashed."""
+        hashed = []
+        get_hash = media_sorter.DuplicateIndex.get_hash.__func__
+
+        def spy(cls, file_path, size, full):
+            hashed.append((os.path.basename(file_path), full))
+            return get_hash(cls, file_path, size, full)
+        monkeypatch.setattr(media_sorter.DuplicateIndex, 'get_hash',
+                            classmethod(spy))
+        monkeypatch.setattr(media_sorter.DuplicateIndex, 'PARTIAL_SIZE', 4)
+        return hashed
+
+    def test_find_duplicate(self, tmpdir, hashed):
+        """Files are hashed only if sizes and partial hashes are equal."""
+        root = tmpdir.mkdir('sorted')
+        root.join('a.jpg').write('0123456789')
+        root.join('b.jpg').write('0123xxxx89')
+        root.join('c.jpg').write('01234')
+        new = tmpdir.join('new.jpg')
+        new.write('0123456789')
+
+        index = media_sorter.DuplicateIndex.load(str(root))
+
+        assert index.find_duplicate(str(new)) == str(root.join('a.jpg'))
+        assert sorted(hashed) == [
+            ('a.jpg', False), ('a.jpg', True), ('b.jpg', False),
+            ('new.jpg', False), ('new.jpg', True)]
+        new.write('0123456788')
+        assert index.find_duplicate(str(new)) is None
+
+    def test_hashes_are_saved(self, tmpdir, hashed):
+        """Hashes of files are not computed again after load."""
+        root = tmpdir.mkdir('sorted')
+        root.join('a.jpg').write('0123456789')
+        new = tmpdir.join('new.jpg')
+        new.write('0123456789')
+
+        index = media_sorter.DuplicateIndex.load(str(root))
+        index.find_duplicate(str(new))
+        index.save()
+        del hashed[:]
+        root.join('b.jpg').write('x123456789')
+        index = media_sorter.DuplicateIndex.load(str(root))
+
+        assert index.find_duplicate(str(new)) == str(root.join('a.jpg'))
+        assert ('a.jpg', False) not in hashed
+        assert ('b.jpg', False) in hashed
+
+    def test_moved_file(self, tmpdir, hashed):
+        """Added file is read from its new place when it was moved."""
+        root = tmpdir.mkdir('sorted')
+        old = tmpdir.join('old.jpg')
+        old.write('0123456789')
+        new = tmpdir.join('new.jpg')
+        new.write('0123456789')
+        index = media_sorter.DuplicateIndex.load(str(root))
+        index.add(str(root.join('a.jpg')), str(old))
+        old.rename(root.join('a.jpg'))    # by worker, after add
+
+        assert index.find_duplicate(str(new)) == str(root.join('a.jpg'))
+        assert ('a.jpg', False) in hashed
+
+    def test_get_free_path(self, tmpdir):
+        """Names of files in destination and added names are not used."""
+        root = tmpdir.mkdir('sorted')
+        root.join('a.jpg').write('1')
+        root.join('a-2.jpg').write('2')
+        new = tmpdir.join('new.jpg')
+        new.write('3')
+        index = media_sorter.DuplicateIndex.load(str(root))
+
+        path = index.get_free_path(str(root.join('a.jpg')))
+        assert path == str(root.join('a-1.jpg'))
+        index.add(path, str(new))
+        assert index.get_free_path(str(root.join('a.jpg'))) \
+            == str(root.join('a-3.jpg'))
+        assert index.get_free_path(str(root.join('b.jpg'))) \
+            == str(root.join('b.jpg'))
+
+    def test_make_dir(self, tmpdir, monkeypatch):
+        """Dirs are created only once and existing dirs are not created."""
+        root = tmpdir.mkdir('sorted')
+        root.mkdir('2016').mkdir('04_april')
+        index = media_sorter.DuplicateIndex.load(str(root))
+        created = []
+        makedirs = os.makedirs
+        monkeypatch.setattr(os, 'makedirs', lambda path, exist_ok: (
+            created.append(path), makedirs(path, exist_ok=exist_ok)))
+
+        for month in ('04_april', '05_may', '05_may'):
+            device = index.make_dir(str(root.join('2016', month)))
+            assert device == root.stat().dev
+        index.make_dir(str(root.join('2016')))
+
+        assert created == [str(root.join('2016', '05_may'))]
+        assert root.join('2016', '05_may').check(dir=True)
+
+
+class TestDateReader(object):
+    """Test reading of dates without exiftool."""
+
+    def test_jpeg(self, tmpdir):
+        """Read DateTimeOriginal from Exif segment."""
+        path = tmpdir.join('a.JPG')
+        path.write_binary(make_jpeg('2016:04:15 19:53:23'))
+        assert media_sorter.DateReader.read(str(path)) == {
+            'SourceFile': str(path), 'DateTimeOriginal': '2016:04:15 19:53:23'}
+
+    def test_mp4(self, tmpdir):
+        """Read CreateDate from 'moov/mvhd' atom."""
+        path = tmpdir.join('a.mp4')
+        path.write_binary(make_mp4('2017:01:02 10:00:00'))
+        assert media_sorter.DateReader.read(str(path)) == {
+            'SourceFile': str(path), 'CreateDate': '2017:01:02 10:00:00'}
+
+    def test_unknown(self, tmpdir):
+        """Broken and unsupported files are not read."""
+        broken = tmpdir.join('a.jpg')
+        broken.write_binary(make_jpeg('2016:04:15 19:53:23')[:40])
+        other = tmpdir.join('a.png')
+        other.write_binary(make_jpeg('2016:04:15 19:53:23'))
+        assert media_sorter.DateReader.read(str(broken)) is None
+        assert media_sorter.DateReader.read(str(other)) is None
+
+    def test_exiftool_is_fallback(self, sorter_env):
+        """Only files without dates in headers are passed to exiftool."""
+        start = sorter_env['start']
+        start.join('a.jpg').write_binary(make_jpeg('2016:04:15 19:53:23'))
+        start.join('b.mov').write_binary(make_mp4('2017:01:02 10:00:00'))
+        start.join('c.jpg').write('2018:03:03 12:00:00')
+
+        files = list(media_sorter.SorterHelpers.get_files_with_date())
+
+        assert [media_sorter.SorterHelpers.get_date(one) for one in files] \
+            == ['2016:04:15 19:53:23', '2017:01:02 10:00:00',
+                '2018:03:03 12:00:00']
+        assert sorter_env['log'].read().split() == ['1']
+
+    def test_no_exiftool(self, sorter_env, monkeypatch):
+        """Files are sorted without exiftool, unknown files are left."""
+        monkeypatch.setattr(media_sorter, 'EXIFTOOL_CMD',
+                            [str(sorter_env['start'].join('no_exiftool'))])
+        start = sorter_env['start']
+        start.join('a.jpg').write_binary(make_jpeg('2016:04:15 19:53:23'))
+        start.join('c.jpg').write('2018:03:03 12:00:00')
+
+        media_sorter.Sorter().run()
+
+        assert sorter_env['destination'].join(
+            '2016', '04_april', '2016-04-15_19-53-23.jpg').check()
+        assert start.join('c.jpg').check()
+
+
+class TestMover(object):
+    """Test moving of files."""
+
+    @pytest.fixture
+    def source(self, tmpdir):
+        """File with known content and old modification time."""
+        path = tmpdir.join('a.jpg')
+        path.write_binary(b'0123456789' * 1000)
+        os.utime(str(path), (1000000000, 1000000000))
+        tmpdir.mkdir('sorted')
+        return path
+
+    @staticmethod
+    def no_rename(monkeypatch):
+        """Make os.rename fail like on different filesystems."""
+        def rename(*args):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        monkeypatch.setattr(os, 'rename', rename)
+
+    def test_rename(self, source, tmpdir):
+        """File on the same filesystem is renamed, not copied."""
+        inode = source.stat().ino
+        future = tmpdir.join('sorted', 'b.jpg')
+
+        assert media_sorter.Mover.move(str(source), str(future)) == 0
+        assert future.stat().ino == inode
+        assert not source.check()
+
+    def test_copy(self, source, tmpdir, monkeypatch):
+        """File is copied with timestamps if it can not be renamed."""
+        self.no_rename(monkeypatch)
+        content = source.read_binary()
+        future = tmpdir.join('sorted', 'b.jpg')
+
+        assert media_sorter.Mover.move(str(source), str(future)) == 10000
+        assert future.read_binary() == content
+        assert future.mtime() == 1000000000
+        assert not source.check()
+
+    def test_broken_content(self, source, tmpdir, monkeypatch):
+        """Copy of the same size, but with other content, is found."""
+        def copy_data(fsrc, fdst):
+            fdst.write(fsrc.read()[::-1])
+        self.no_rename(monkeypatch)
+        monkeypatch.setattr(media_sorter.Mover, 'copy_data', copy_data)
+        future = tmpdir.join('sorted', 'b.jpg')
+
+        with pytest.raises(IOError):
+            media_sorter.Mover.move(str(source), str(future))
+        assert source.check()
+        assert tmpdir.join('sorted').listdir() == []
+
+    def test_copy_without_kernel(self, source, tmpdir, monkeypatch):
+        """File is copied by Python if kernel can not copy it."""
+        def unsupported(*args):
+            raise OSError(errno.ENOSYS, 'Function not implemented')
+        self.no_rename(monkeypatch)
+        monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+        monkeypatch.setattr(os, 'sendfile', unsupported, raising=False)
+        content = source.read_binary()
+        future = tmpdir.join('sorted', 'b.jpg')
+
+        media_sorter.Mover.move(str(source), str(future))
+        assert future.read_binary() == content
+
+    def test_broken_copy(self, source, tmpdir, monkeypatch):
+        """Source is kept and broken copy is removed."""
+        def copy_half(fsrc, fdst):
+            fdst.write(fsrc.read(100))
+            return 100
+        self.no_rename(monkeypatch)
+        monkeypatch.setattr(media_sorter.Mover, 'copy_data', copy_half)
+        future = tmpdir.join('sorted', 'b.jpg')
+
+        with pytest.raises(IOError):
+            media_sorter.Mover.move(str(source), str(future))
+        assert source.check()
+        assert not future.check()
+
+    def test_existing_part_is_kept(self, source, tmpdir, monkeypatch):
+        """Part file of other copying is not overwritten or removed."""
+        self.no_rename(monkeypatch)
+        part = tmpdir.join('sorted', 'b.jpg' + media_sorter.Mover.PART)
+        part.write('other')
+
+        with pytest.raises(FileExistsError):
+            media_sorter.Mover.move(str(source),
+                                    str(tmpdir.join('sorted', 'b.jpg')))
+        assert part.read() == 'other'
+        assert source.check()
+
+    def test_existing_file_is_kept(self, source, tmpdir):
+        """File is never moved over another file."""
+        future = tmpdir.join('sorted', 'b.jpg')
+        future.write('other')
+
+        with pytest.raises(OSError):
+            media_sorter.Mover.move(str(source), str(future))
+        assert future.read() == 'other'
+        assert source.check()
@@ -2,29 +2,935 @@
 """Find all possible permutations from provided word.
 
 And checks if generated words exists.
+
+Words are not generated from all permutations: dictionary is loaded into
+a trie and only prefixes which exist in dictionary are extended, so time
+depends on number of found words, not on number of permutations.
+
+By default words are looked up in SignatureIndex - words keyed by their
+sorted letters, built once and saved next to the word list (wordsEn.idx).
+Queries with blanks ('?' - any letter), patterns like 'h???e', length
+limits and required letters are answered with the trie. For big word lists
+trie can be minimized and saved (PackedTrie, wordsEn.dawg).
 """
 
 
+import argparse
+import array
+import bisect
+import collections
 import itertools
+import json
+import mmap
+import multiprocessing
+import os
 from pprint import pprint
+import socketserver
+import struct
 import sys
+import tempfile
+
+
+WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'wordsEn.txt')
+END = ''    # key of trie node which marks end of word
+BLANK = '?'    # blank tile or any letter in pattern
+# Scrabble values of letters
+LETTER_VALUES = dict(
+    (letter, value)
+    for letters, value in [('aeilnorstu', 1), ('dg', 2), ('bcmp', 3),
+                           ('fhvwy', 4), ('k', 5), ('jx', 8), ('qz', 10)]
+    for letter in letters)
+
+
+def load_words(words_file=None):
+    """Read dictionary.
+
+    :param words_file: file with one word per line, WORDS_FILE by default
+    :return: list of words
+    """
+    with open(words_file or WORDS_FILE, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def build_trie(words):
+    """Make trie of words.
+
+    :param words: iterable of words
+    :return: nested dictionaries: letter -> node. Node of the last letter
+             of a word has END key.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for letter in word:
+            node = node.setdefault(letter, {})
+        node[END] = True
+    return trie
+
+
+def find_words(letters, trie, pattern=None, min_length=1, max_length=None,
+               required=''):
+    """Find words which can be made from letters (each letter used once).
+
+    Words are ordered by length and then like in itertools.permutations
+    of letters, every word is returned once. All conditions are checked
+    during search, so branches which can not satisfy them are not visited.
+
+    :param letters: string of letters, BLANK can be any letter
+    :param trie: trie from build_trie
+    :param pattern: string like 'h???e': word has the same length, letters
+                    of pattern are at the same places (they are not taken
+                    from letters), BLANK places are filled from letters.
+    :param min_length: minimal length of words
+    :param max_length: maximal length of words
+    :param required: letters which must be in words
+    :return: list of words
+    """
+    # positions of every letter, the first unused one orders the choices
+    positions = {}
+    for i, letter in enumerate(letters):
+        positions.setdefault(letter, []).append(i)
+    blanks = positions.pop(BLANK, [])
+    used = dict.fromkeys(positions, 0)
+    used_blanks = [0]
+    missing = collections.Counter(required)
+    missing_num = [sum(missing.values())]
+    prefix = []
+    found = []
+
+    if pattern:
+        min_length = max_length = len(pattern)
+        # number of places which must be filled from letters after i-th
+        places = [pattern[i:].count(BLANK) for i in range(len(pattern) + 1)]
+    limit = len(pattern) if pattern else len(letters)
+    if max_length is not None:
+        limit = min(limit, max_length)
+
+    def step(node, letter, depth):
+        child = node[letter]
+        prefix.append(letter)
+        in_missing = missing[letter] > 0
+        if in_missing:
+            missing[letter] -= 1
+            missing_num[0] -= 1
+        if END in child and depth + 1 >= min_length and not missing_num[0]:
+            found.append(''.join(prefix))
+        visit(child, depth + 1)
+        if in_missing:
+            missing[letter] += 1
+            missing_num[0] += 1
+        prefix.pop()
+
+    def visit(node, depth):
+        tiles_left = len(letters) - depth if not pattern \
+            else len(letters) - (places[0] - places[depth])
+        if depth >= limit or missing_num[0] > limit - depth:
+            return
+        if pattern:
+            if places[depth] > tiles_left:
+                return
+            if pattern[depth] != BLANK:
+                if pattern[depth] in node:
+                    step(node, pattern[depth], depth)
+                return
+        elif depth + tiles_left < min_length:
+            return
+
+        choices = [(positions[letter][used[letter]], letter, True)
+                   for letter in positions
+                   if letter in node and used[letter] < len(positions[letter])]
+        if used_blanks[0] < len(blanks):
+            taken = set(choice[1] for choice in choices)
+            choices.extend((blanks[used_blanks[0]], letter, False)
+                           for letter in node
+                           if letter != END and letter not in taken)
+        choices.sort()
+        for _, letter, is_tile in choices:
+            if is_tile:
+                used[letter] += 1
+                step(node, letter, depth)
+                used[letter] -= 1
+            else:
+                used_blanks[0] += 1
+                step(node, letter, depth)
+                used_blanks[0] -= 1
+
+    visit(trie, 0)
+    found.sort(key=len)
+    return found
+
+
+def score_word(word, letters, pattern=None, values=None):
+    """Sum of values of letters of word (letters of blanks cost nothing).
+
+    :param word: word found by find_words
+    :param letters: letters of query (with BLANK)
+    :param pattern: pattern of query
+    :param values: dictionary: letter -> value, LETTER_VALUES by default
+    :return: number
+    """
+    values = LETTER_VALUES if values is None else values
+    from_letters = collections.Counter(
+        letter for i, letter in enumerate(word)
+        if not pattern or pattern[i] == BLANK)
+    tiles = collections.Counter(letters)
+    score = sum(values.get(letter, 0) for letter in word)
+    for letter, count in from_letters.items():
+        score -= values.get(letter, 0) * max(0, count - tiles[letter])
+    return score
+
+
+def permutation_order(letters):
+    """Make sort key which orders words like find_words does.
+
+    :param letters: string of letters
+    :return: function: word -> key
+    """
+    positions = {}
+    for i, letter in enumerate(letters):
+        positions.setdefault(letter, []).append(i)
+
+    def key(word):
+        used = dict.fromkeys(positions, 0)
+        indexes = []
+        for letter in word:
+            indexes.append(positions[letter][used[letter]])
+            used[letter] += 1
+        return len(word), indexes
+    return key
+
+
+class _Strings(object):
+    """Strings stored in one blob as a sequence of bytes (for bisect)."""
+
+    def __init__(self, offsets, blob, start=0):
+        """Use strings.
+
+        :param offsets: offsets of strings in blob (and end of last one)
+        :param blob: bytes or mmap
+        :param start: offset of the first string in blob
+        """
+        self.offsets = offsets
+        self.blob = blob
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.start + self.offsets[i]:
+                         self.start + self.offsets[i + 1]]
+
+    def tobytes(self):
+        """All strings as one bytes object."""
+        return self.blob[self.start:self.start + self.offsets[-1]]
+
+
+def _replace_file(path, chunks):
+    """Write file through temporary file in the same dir.
+
+    So other processes never see a half-written file, even if they write
+    the same file at the same time.
+
+    :param path: path to file
+    :param chunks: iterable of bytes
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class _SavedDictionary(object):
+    """Dictionary which is built from words file and saved next to it.
+
+    Subclasses define EXTENSION of saved file, build(words), save(path)
+    and load(path).
+    """
+
+    EXTENSION = None
+
+    def __enter__(self):
+        """Use dictionary in with statement."""
+        return self
+
+    def __exit__(self, *args):
+        """Close dictionary at the end of with statement."""
+        self.close()
+
+    def close(self):
+        """Release resources of dictionary."""
+
+    @classmethod
+    def path(cls, words_file=None):
+        """Path of saved dictionary of words file.
+
+        :param words_file: file with one word per line, WORDS_FILE by default
+        :return: path
+        """
+        return os.path.splitext(words_file or WORDS_FILE)[0] + cls.EXTENSION
+
+    @classmethod
+    def update(cls, words_file=None, force=False):
+        """Build and save dictionary if it is older than words file.
+
+        It must be done once before processes load dictionary, else each
+        of them builds it.
+
+        :param words_file: file with one word per line, WORDS_FILE by default
+        :param force: build dictionary even if it is not outdated
+        :return: path of saved dictionary
+        """
+        words_file = words_file or WORDS_FILE
+        saved_file = cls.path(words_file)
+        try:
+            fresh = os.path.getmtime(saved_file) >= os.path.getmtime(
+                words_file)
+        except OSError:
+            fresh = False
+        if force or not fresh:
+            cls.build(load_words(words_file)).save(saved_file)
+        return saved_file
+
+    @classmethod
+    def open(cls, words_file=None, build=True):
+        """Load saved dictionary of words file.
+
+        :param words_file: file with one word per line, WORDS_FILE by default
+        :param build: build and save dictionary if it is outdated or broken,
+                      else it is only loaded
+        :return: instance of cls
+        """
+        if not build:
+            return cls.load(cls.path(words_file))
+        try:
+            return cls.load(cls.update(words_file))
+        except ValueError:    # e.g. saved on machine with other byte order
+            return cls.load(cls.update(words_file, force=True))
+
+
+class SignatureIndex(_SavedDictionary):
+    """Words keyed by signature - their letters in sorted order.
+
+    Words made from letters are found by looking up signatures of all
+    sub-multisets of letters. Index is saved to a binary file which is
+    used through mmap, so it is not parsed on load:
+        header: MAGIC, number of signatures, number of words
+        uint32 offsets of signatures in signatures blob (+ end)
+        uint32 number of the first word of each signature (+ end)
+        uint32 offsets of words in words blob (+ end)
+        signatures blob (UTF-8, sorted), words blob (UTF-8)
+    Integers are in native byte order (it is a part of MAGIC).
+    """
+
+    MAGIC = b'SIGIDX1' + sys.byteorder[0].encode('ascii')
+    HEADER = struct.Struct('=8sII')
+    EXTENSION = '.idx'
+
+    def __init__(self, signatures, first_words, words, mapped=None):
+        """Use tables of index (see class docstring).
+
+        :param signatures: _Strings of sorted signatures
+        :param first_words: number of the first word of each signature
+        :param words: _Strings of words
+        :param mapped: mmap which tables point to (closed in close())
+        """
+        self.signatures = signatures
+        self.first_words = first_words
+        self.words = words
+        self._mapped = mapped
+
+    def close(self):
+        """Release mapped file."""
+        if self._mapped is not None:
+            for table in (self.signatures.offsets, self.first_words,
+                          self.words.offsets):
+                table.release()
+            self.signatures = self.words = self.first_words = None
+            self._mapped.close()
+            self._mapped = None
+
+    @staticmethod
+    def signature(word):
+        """Letters of word in sorted order."""
+        return ''.join(sorted(word))
+
+    @classmethod
+    def build(cls, words):
+        """Make index of words.
+
+        :param words: iterable of words (repeated words are kept once)
+        :return: SignatureIndex
+        """
+        groups = {}
+        for word in sorted(set(words)):
+            groups.setdefault(cls.signature(word).encode('utf-8'),
+                              []).append(word.encode('utf-8'))
+        signature_offsets = array.array('I', [0])
+        first_words = array.array('I', [0])
+        word_offsets = array.array('I', [0])
+        signatures = []
+        encoded_words = []
+        for signature in sorted(groups):
+            signatures.append(signature)
+            signature_offsets.append(signature_offsets[-1] + len(signature))
+            for word in groups[signature]:
+                encoded_words.append(word)
+                word_offsets.append(word_offsets[-1] + len(word))
+            first_words.append(len(encoded_words))
+        return cls(_Strings(signature_offsets, b''.join(signatures)),
+                   first_words,
+                   _Strings(word_offsets, b''.join(encoded_words)))
+
+    def save(self, index_file):
+        """Write index to binary file.
+
+        :param index_file: path to file
+        """
+        header = self.HEADER.pack(self.MAGIC, len(self.signatures),
+                                  len(self.words))
+        _replace_file(index_file, [header] + [
+            table.tobytes() for table in (
+                self.signatures.offsets, self.first_words,
+                self.words.offsets, self.signatures, self.words)])
+
+    @classmethod
+    def load(cls, index_file):
+        """Map index file to memory.
+
+        :param index_file: path to file saved by save()
+        :return: SignatureIndex
+        :raise:
+            ValueError: If file is not an index for this machine.
+        """
+        with open(index_file, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tables = []
+        try:
+            magic, signatures_num, words_num = cls.HEADER.unpack_from(mapped)
+            if magic != cls.MAGIC:
+                raise ValueError('Wrong index file: %s' % index_file)
+            start = cls.HEADER.size
+            for num in (signatures_num, signatures_num, words_num):
+                end = start + 4 * (num + 1)
+                with memoryview(mapped)[start:end] as view:
+                    tables.append(view.cast('I'))
+                start = end
+            signatures = _Strings(tables[0], mapped, start)
+            words = _Strings(tables[2], mapped, start + tables[0][-1])
+            if len(mapped) != words.start + tables[2][-1]:
+                raise ValueError('Broken index file: %s' % index_file)
+        except (ValueError, struct.error, TypeError):
+            for table in tables:
+                table.release()
+            mapped.close()
+            raise
+        return cls(signatures, tables[1], words, mapped)
+
+    def lookup(self, signature):
+        """Find words with signature.
+
+        :param signature: string from signature()
+        :return: list of words
+        """
+        key = signature.encode('utf-8')
+        i = bisect.bisect_left(self.signatures, key)
+        if i == len(self.signatures) or self.signatures[i] != key:
+            return []
+        return [self.words[j].decode('utf-8')
+                for j in range(self.first_words[i], self.first_words[i + 1])]
+
+    def find_words(self, letters):
+        """Find words which can be made from letters (each letter used once).
+
+        Order of words is the same as of module's find_words.
+
+        :param letters: string of letters
+        :return: list of words
+        """
+        counts = sorted((letter, letters.count(letter))
+                        for letter in set(letters))
+        found = []
+        for repeats in itertools.product(
+                *(range(count + 1) for _, count in counts)):
+            signature = ''.join(letter * repeat for (letter, _), repeat
+                                in zip(counts, repeats))
+            if signature:
+                found.extend(self.lookup(signature))
+        found.sort(key=permutation_order(letters))
+        return found
+
+
+class _PackedNode(object):
+    """Node of PackedTrie which looks like a node of build_trie.
+
+    So find_words works with PackedTrie as with dictionaries. Edges of
+    node are read from arrays once, when they are needed first.
+    """
+
+    __slots__ = ('trie', 'node', '_edges')
+
+    def __init__(self, trie, node):
+        self.trie = trie
+        self.node = node
+        self._edges = None
+
+    @property
+    def edges(self):
+        """Dictionary: letter -> number of child node (with END)."""
+        if self._edges is None:
+            trie = self.trie
+            start = trie.first_edges[self.node]
+            end = trie.first_edges[self.node + 1]
+            self._edges = dict(zip(map(chr, trie.labels[start:end]),
+                                   trie.targets[start:end]))
+            if trie.finals[self.node]:
+                self._edges[END] = None
+        return self._edges
+
+    def __contains__(self, letter):
+        return letter in self.edges
+
+    def __getitem__(self, letter):
+        return _PackedNode(self.trie, self.edges[letter])
+
+    def __iter__(self):
+        return iter(self.edges)
+
+
+class PackedTrie(_SavedDictionary):
+    """Minimized trie (DAWG) of words in flat arrays.
+
+    Equal suffixes of words share nodes, so it is much smaller than trie
+    of dictionaries. Node 0 is the root. Edges of a node are sorted by
+    letter and stored one after another. File (used through mmap, not
+    parsed on load):
+        header: MAGIC, number of nodes, number of edges
+        uint32 number of the first edge of each node (+ end)
+        uint32 letters of edges (Unicode code points)
+        uint32 target nodes of edges
+        uint8 1 for nodes where words end
+    Integers are in native byte order (it is a part of MAGIC).
+    """
+
+    MAGIC = b'DAWG001' + sys.byteorder[0].encode('ascii')
+    HEADER = struct.Struct('=8sII')
+    EXTENSION = '.dawg'
+
+    def __init__(self, first_edges, labels, targets, finals, mapped=None):
+        """Use arrays of trie (see class docstring).
+
+        :param mapped: mmap which arrays point to (closed in close())
+        """
+        self.first_edges = first_edges
+        self.labels = labels
+        self.targets = targets
+        self.finals = finals
+        self._mapped = mapped
+
+    def close(self):
+        """Release mapped file."""
+        if self._mapped is not None:
+            for table in (self.first_edges, self.labels, self.targets,
+                          self.finals):
+                table.release()
+            self._mapped.close()
+            self._mapped = None
+
+    @property
+    def root(self):
+        """Root node for find_words."""
+        return _PackedNode(self, 0)
+
+    def child(self, node, letter):
+        """Find node after letter.
+
+        :param node: number of node
+        :param letter: one letter
+        :return: number of child node or None
+        """
+        start = self.first_edges[node]
+        end = self.first_edges[node + 1]
+        code = ord(letter)
+        i = bisect.bisect_left(self.labels, code, start, end)
+        if i < end and self.labels[i] == code:
+            return self.targets[i]
+        return None
+
+    def walk(self, prefix):
+        """Find node after all letters of prefix.
+
+        :return: number of node or None
+        """
+        node = 0
+        for letter in prefix:
+            node = self.child(node, letter)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, word):
+        """Check if word is in trie."""
+        node = self.walk(word)
+        return node is not None and bool(self.finals[node])
+
+    def has_prefix(self, prefix):
+        """Check if some words start with prefix."""
+        return self.walk(prefix) is not None
+
+    def words(self, prefix=''):
+        """All words which start with prefix, in sorted order.
+
+        :return: generator of words
+        """
+        node = self.walk(prefix)
+        if node is None:
+            return
+        stack = [(node, prefix)]
+        while stack:
+            node, word = stack.pop()
+            if self.finals[node]:
+                yield word
+            stack.extend(
+                (self.targets[edge], word + chr(self.labels[edge]))
+                for edge in reversed(range(self.first_edges[node],
+                                           self.first_edges[node + 1])))
+
+    @classmethod
+    def build(cls, words):
+        """Make minimized trie of words.
+
+        Words are added in sorted order and nodes which can not change
+        anymore are replaced by equal nodes added before (Daciuk et al.,
+        incremental construction from sorted data).
+
+        :param words: iterable of words
+        :return: PackedTrie
+        """
+        root = [False, {}]    # node: [is final, {letter: node}]
+        register = {}
+        unchecked = []    # (parent, letter, child) of the last word
+
+        def minimize(down_to):
+            while len(unchecked) > down_to:
+                parent, letter, child = unchecked.pop()
+                key = (child[0], tuple((one, id(node)) for one, node
+                                       in sorted(child[1].items())))
+                if key in register:
+                    parent[1][letter] = register[key]
+                else:
+                    register[key] = child
+
+        previous = ''
+        for word in sorted(set(words)):
+            common = 0
+            for letter, previous_letter in zip(word, previous):
+                if letter != previous_letter:
+                    break
+                common += 1
+            minimize(common)
+            node = unchecked[-1][2] if unchecked else root
+            for letter in word[common:]:
+                child = [False, {}]
+                node[1][letter] = child
+                unchecked.append((node, letter, child))
+                node = child
+            node[0] = True
+            previous = word
+        minimize(0)
+
+        numbers = {id(root): 0}
+        order = [root]
+        first_edges = array.array('I', [0])
+        labels = array.array('I')
+        targets = array.array('I')
+        finals = bytearray()
+        for node in order:    # order grows while new nodes are found
+            for letter, child in sorted(node[1].items()):
+                if id(child) not in numbers:
+                    numbers[id(child)] = len(order)
+                    order.append(child)
+                labels.append(ord(letter))
+                targets.append(numbers[id(child)])
+            first_edges.append(len(labels))
+            finals.append(node[0])
+        return cls(first_edges, labels, targets, finals)
+
+    def save(self, dawg_file):
+        """Write trie to binary file.
+
+        :param dawg_file: path to file
+        """
+        header = self.HEADER.pack(self.MAGIC, len(self.finals),
+                                  len(self.labels))
+        _replace_file(dawg_file, [header] + [
+            bytes(table) for table in (self.first_edges, self.labels,
+                                       self.targets, self.finals)])
+
+    @classmethod
+    def load(cls, dawg_file):
+        """Map trie file to memory.
+
+        :param dawg_file: path to file saved by save()
+        :return: PackedTrie
+        :raise:
+            ValueError: If file is not a trie for this machine.
+        """
+        with open(dawg_file, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tables = []
+        try:
+            magic, nodes_num, edges_num = cls.HEADER.unpack_from(mapped)
+            if magic != cls.MAGIC:
+                raise ValueError('Wrong trie file: %s' % dawg_file)
+            start = cls.HEADER.size
+            for num, kind, size in [(nodes_num + 1, 'I', 4),
+                                    (edges_num, 'I', 4), (edges_num, 'I', 4),
+                                    (nodes_num, 'B', 1)]:
+                with memoryview(mapped)[start:start + num * size] as view:
+                    tables.append(view.cast(kind))
+                start += num * size
+            if start != len(mapped):
+                raise ValueError('Broken trie file: %s' % dawg_file)
+        except (ValueError, struct.error, TypeError):
+            for table in tables:
+                table.release()
+            mapped.close()
+            raise
+        return cls(*tables, mapped=mapped)
+
+
+def make_finder(engine='index', score=False, words_file=None, build=True,
+                **conditions):
+    """Load dictionary for many queries.
+
+    SignatureIndex can not look up blanks and conditions, trie is used for
+    such queries.
+
+    :param engine: 'index' (SignatureIndex), 'trie' or 'dawg' (PackedTrie)
+    :param score: return words with scores (see score_word), words with
+                  the biggest scores first.
+    :param words_file: file with one word per line, WORDS_FILE by default
+    :param build: build saved index or trie if it is outdated, else it is
+                  only loaded (see _SavedDictionary.open)
+    :param conditions: pattern, min_length, max_length, required
+                       (see find_words)
+    :return: function: letters -> list of words or of tuples (word, score)
+    """
+    tries = []
+
+    def get_trie():
+        if not tries:
+            tries.append(build_trie(load_words(words_file)))
+        return tries[0]
+
+    if engine == 'dawg':
+        dawg = PackedTrie.open(words_file, build)
+
+        def find(letters):
+            return find_words(letters, dawg.root, **conditions)
+    elif engine == 'trie' or conditions:
+        get_trie()
+
+        def find(letters):
+            return find_words(letters, get_trie(), **conditions)
+    else:
+        index = SignatureIndex.open(words_file, build)
+
+        def find(letters):
+            if BLANK in letters:
+                return find_words(letters, get_trie())
+            return index.find_words(letters)
+
+    if not score:
+        return find
+
+    def find_with_scores(letters):
+        scored = [(word, score_word(word, letters, conditions.get('pattern')))
+                  for word in find(letters)]
+        scored.sort(key=lambda one: -one[1])
+        return scored
+    return find_with_scores
+
+
+def format_result(letters, words):
+    """Format result of one query as one line of JSON."""
+    return json.dumps({'letters': letters, 'words': words})
+
+
+def read_queries(lines):
+    """Get queries from lines of text (one query per line).
+
+    :param lines: iterable of lines
+    :return: generator of strings (empty lines are skipped)
+    """
+    for line in lines:
+        letters = line.strip()
+        if letters:
+            yield letters
+
+
+_finder = None
+
+
+def _init_worker(engine, options):
+    """Load dictionary once per process."""
+    global _finder  # pylint: disable=global-statement
+    _finder = make_finder(engine, **options)
+
+
+def _find_in_worker(letters):
+    """Run one query in a worker process."""
+    return letters, _finder(letters)
+
+
+def find_batch(queries, engine='index', jobs=None, words_file=None,
+               **options):
+    """Find words for many queries in a pool of processes.
+
+    Saved index or trie is built (if it is outdated) before processes are
+    started, processes only load it.
+
+    :param queries: iterable of strings of letters
+    :param engine: 'index', 'trie' or 'dawg' (see make_finder)
+    :param jobs: number of processes. Number of CPUs by default.
+    :param words_file: file with one word per line, WORDS_FILE by default
+    :param options: score and conditions (see make_finder)
+    :return: generator of tuples (letters, words) in order of completion
+    """
+    options['words_file'] = words_file or WORDS_FILE
+    jobs = jobs or multiprocessing.cpu_count()
+    if jobs <= 1:
+        _init_worker(engine, options)
+        for result in map(_find_in_worker, queries):
+            yield result
+        return
+
+    saved = {'index': SignatureIndex, 'dawg': PackedTrie}.get(engine)
+    if saved is not None:
+        saved.open(options['words_file']).close()
+    options['build'] = False
+    pool = multiprocessing.Pool(jobs, _init_worker, (engine, options))
+    try:
+        for result in pool.imap_unordered(_find_in_worker, queries,
+                                          chunksize=16):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def serve_lines(finder, input_stream, output_stream):
+    """Answer queries one by one as soon as they are read.
+
+    :param finder: function from make_finder
+    :param input_stream: file to read queries from (one per line)
+    :param output_stream: file to write results to (one per line)
+    """
+    for letters in read_queries(iter(input_stream.readline, '')):
+        output_stream.write(format_result(letters, finder(letters)) + '\n')
+        output_stream.flush()
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """Answer queries of one connection (one query per line)."""
+
+    def handle(self):
+        """Read queries until client closes connection."""
+        for line in iter(self.rfile.readline, b''):
+            letters = line.decode('utf-8').strip()
+            if letters:
+                result = format_result(letters, self.server.finder(letters))
+                self.wfile.write(result.encode('utf-8') + b'\n')
+
+
+class QueryServer(socketserver.ThreadingTCPServer):
+    """Local TCP server which keeps dictionary loaded."""
+
+    daemon_threads = True
+    allow_reuse_address = True
 
+    def __init__(self, port, finder, host='127.0.0.1'):
+        """Start listening.
 
-eng_words_file = 'wordsEn.txt'
+        :param port: TCP port (0 - any free port)
+        :param finder: function from make_finder
+        :param host: address to listen on
+        """
+        socketserver.ThreadingTCPServer.__init__(self, (host, port),
+                                                 QueryHandler)
+        self.finder = finder
 
-a = sys.argv[1:][0] if len(sys.argv[1:]) > 0 else 'house'
-a = list(a)
 
-with open(eng_words_file, 'r') as f:
-    words_list = [line.strip() for line in f]
+def main(argv=None):
+    """Print words made from letters of the first argument."""
+    parser = argparse.ArgumentParser(
+        description='Find words made from letters.')
+    parser.add_argument('letters', nargs='?', default='house')
+    parser.add_argument('--engine', choices=['index', 'trie', 'dawg'],
+                        help='saved signature index (fast start, default '
+                             'for one query), trie (fast queries, default '
+                             'for other modes) or saved minimized trie '
+                             '(fast start, small memory)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--batch', metavar='FILE',
+                      help='queries from FILE (one per line, "-" for '
+                           'stdin), results as JSON lines as they are ready')
+    mode.add_argument('--serve', action='store_true',
+                      help='answer queries from stdin one by one')
+    mode.add_argument('--port', type=int,
+                      help='answer queries on localhost TCP port')
+    parser.add_argument('--jobs', type=int,
+                        help='processes for --batch (number of CPUs)')
+    query = parser.add_argument_group(
+        'queries', 'letters may have blanks "{0}" (any letter)'.format(BLANK))
+    query.add_argument('--pattern',
+                       help='like h???e: letters of pattern are fixed, '
+                            'blanks are filled from letters')
+    query.add_argument('--min-length', type=int, help='minimal word length')
+    query.add_argument('--max-length', type=int, help='maximal word length')
+    query.add_argument('--require', metavar='LETTERS',
+                       help='letters which must be in every word')
+    query.add_argument('--score', action='store_true',
+                       help='show scores of words (Scrabble values of '
+                            'letters), best words first')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    one_query = not (args.batch or args.serve or args.port is not None)
+    args.engine = args.engine or ('index' if one_query else 'trie')
+    options = dict((name, value) for name, value in [
+        ('pattern', args.pattern), ('min_length', args.min_length),
+        ('max_length', args.max_length), ('required', args.require)]
+        if value)
+    options['score'] = args.score
 
-real_words = []
-for i in range(1, len(a) + 1):
-    combinations = list(itertools.permutations(a, i))
+    if args.batch:
+        with (sys.stdin if args.batch == '-' else open(args.batch)) as f:
+            for letters, words in find_batch(read_queries(f), args.engine,
+                                             args.jobs, **options):
+                sys.stdout.write(format_result(letters, words) + '\n')
+                sys.stdout.flush()
+    elif args.serve:
+        serve_lines(make_finder(args.engine, **options),
+                    sys.stdin, sys.stdout)
+    elif args.port is not None:
+        server = QueryServer(args.port, make_finder(args.engine, **options))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        real_words = make_finder(args.engine, **options)(args.letters)
+        pprint(list(enumerate(real_words, start=1)))
 
-    for variant in combinations:
-        word = ''.join(variant)
-        if word in words_list and word not in real_words:
-            real_words.append(word)
 
-pprint(list(enumerate(real_words, start=1)))
+if __name__ == '__main__':
+    main()
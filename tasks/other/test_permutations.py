@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""Tests of search of words made from letters."""
+
+import io
+import itertools
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from tasks.other import permutations
+
+
+WORDS = ['a', 'an', 'ban', 'banana', 'nab', 'nan', 'bean', 'b']
+
+
+def find_by_permutations(letters, words):
+    """Find words like original script did (with all permutations)."""
+    real_words = []
+    for i in range(1, len(letters) + 1):
+        for variant in itertools.permutations(letters, i):
+            word = ''.join(variant)
+            if word in words and word not in real_words:
+                real_words.append(word)
+    return real_words
+
+
+@pytest.fixture(scope='module')
+def trie():
+    """Trie of WORDS."""
+    return permutations.build_trie(WORDS)
+
+
+@pytest.mark.parametrize('letters', ['banana', 'nab', 'aab', 'xyz', ''])
+def test_find_words(trie, letters):
+    """Words and their order are the same as with all permutations."""
+    assert permutations.find_words(letters, trie) \
+        == find_by_permutations(letters, WORDS)
+
+
+def test_dictionary():
+    """Words from dictionary file are found."""
+    trie = permutations.build_trie(permutations.load_words())
+    assert permutations.find_words('house', trie) == find_by_permutations(
+        'house', set(permutations.load_words()))
+
+
+@pytest.mark.parametrize('letters, conditions, words', [
+    ('n??', {}, ['a', 'b', 'an', 'nab', 'nan', 'ban']),
+    ('ban?', {'min_length': 3, 'max_length': 3},
+     ['ban', 'nab', 'nan']),
+    ('a?', {'pattern': 'b??n'}, ['bean']),
+    ('banana', {'pattern': 'b??n'}, []),
+    ('???', {'required': 'nn'}, ['nan']),
+    ('banana', {'required': 'b', 'min_length': 4}, ['banana']),
+])
+def test_conditions(trie, letters, conditions, words):
+    """Blanks, patterns, lengths and required letters limit words."""
+    assert permutations.find_words(letters, trie, **conditions) == words
+
+
+def test_score_word():
+    """Letters of blanks cost nothing, letters of pattern cost."""
+    assert permutations.score_word('ban', 'ban') == 5
+    assert permutations.score_word('ban', 'b?n') == 4
+    assert permutations.score_word('bean', 'a?', pattern='b??n') == 5
+
+
+class TestSignatureIndex(object):
+    """Test saved index of signatures."""
+
+    @pytest.fixture
+    def words_file(self, tmpdir):
+        """File with WORDS."""
+        words_file = tmpdir.join('words.txt')
+        words_file.write('\n'.join(WORDS) + '\n')
+        return words_file
+
+    @pytest.mark.parametrize('letters', ['banana', 'nab', 'aab', 'xyz', ''])
+    def test_find_words(self, words_file, trie, letters):
+        """Saved index finds the same words as trie."""
+        with permutations.SignatureIndex.open(str(words_file)) as index:
+            assert index.find_words(letters) \
+                == permutations.find_words(letters, trie)
+        assert words_file.new(ext='idx').check()
+
+    def test_outdated_index(self, words_file):
+        """Index is built again if words file was changed."""
+        permutations.SignatureIndex.open(str(words_file)).close()
+        words_file.write('nana\n', mode='a')
+        os.utime(str(words_file), (2e9, 2e9))
+        with permutations.SignatureIndex.open(str(words_file)) as index:
+            assert index.lookup('aann') == ['nana']
+
+    def test_repeated_words(self, words_file):
+        """Word which is repeated in words file is found once."""
+        words_file.write('nab\nban\n', mode='a')
+        with permutations.SignatureIndex.open(str(words_file)) as index:
+            assert index.lookup('abn') == ['ban', 'nab']
+            assert index.find_words('nab') == ['a', 'b', 'an', 'nab', 'ban']
+
+    def test_broken_index(self, tmpdir):
+        """Error is raised for files which are not index."""
+        index_file = tmpdir.join('broken.idx')
+        index_file.write('not an index file')
+        with pytest.raises(ValueError):
+            permutations.SignatureIndex.load(str(index_file))
+
+
+class TestPackedTrie(object):
+    """Test minimized trie saved to file."""
+
+    @pytest.fixture
+    def dawg(self, tmpdir):
+        """Load PackedTrie of WORDS from file."""
+        words_file = tmpdir.join('words.txt')
+        words_file.write('\n'.join(WORDS) + '\n')
+        with permutations.PackedTrie.open(str(words_file)) as dawg:
+            yield dawg
+
+    def test_queries(self, dawg):
+        """Words and prefixes are found, suffixes are shared."""
+        assert list(dawg.words()) == sorted(WORDS)
+        assert list(dawg.words('ba')) == ['ban', 'banana']
+        assert 'nab' in dawg and 'na' not in dawg and 'nabs' not in dawg
+        assert dawg.has_prefix('bea') and not dawg.has_prefix('bb')
+        # ends of 'bean', 'nan' and 'an' are one node
+        assert dawg.walk('bean') == dawg.walk('nan') == dawg.walk('an')
+
+    @pytest.mark.parametrize('letters', ['banana', 'nab', 'n??', ''])
+    def test_find_words(self, dawg, trie, letters):
+        """Words are found as with trie of dictionaries."""
+        assert permutations.find_words(letters, dawg.root) \
+            == permutations.find_words(letters, trie)
+
+    def test_broken_file(self, tmpdir):
+        """Error is raised for files which are not trie."""
+        dawg_file = tmpdir.join('broken.dawg')
+        dawg_file.write_binary(permutations.PackedTrie.MAGIC + b'\x01' * 20)
+        with pytest.raises(ValueError):
+            permutations.PackedTrie.load(str(dawg_file))
+
+
+class TestModes(object):
+    """Test batch and server modes."""
+
+    QUERIES = ['house', 'banana', 'stream', 'xyz']
+
+    @pytest.fixture(autouse=True)
+    def words_file(self, tmpdir, monkeypatch):
+        """Copy of dictionary, so saved indexes are made in tmpdir."""
+        words_file = tmpdir.join('words.txt')
+        with open(permutations.WORDS_FILE) as f:
+            words_file.write(f.read())
+        monkeypatch.setattr(permutations, 'WORDS_FILE', str(words_file))
+        return words_file
+
+    @pytest.fixture
+    def expected(self):
+        """Results of QUERIES."""
+        finder = permutations.make_finder('trie')
+        return dict((letters, finder(letters)) for letters in self.QUERIES)
+
+    @pytest.mark.parametrize('engine', ['index', 'dawg'])
+    @pytest.mark.parametrize('jobs', [1, 4])
+    def test_batch(self, tmpdir, expected, engine, jobs):
+        """All queries are answered by pool of processes."""
+        lines = [one + '\n' for one in self.QUERIES * 8] + ['\n']
+        results = list(permutations.find_batch(
+            permutations.read_queries(lines), engine=engine, jobs=jobs))
+        assert len(results) == len(self.QUERIES) * 8
+        assert dict(results) == expected
+        saved_file = {'index': 'words.idx', 'dawg': 'words.dawg'}[engine]
+        assert sorted(one.basename for one in tmpdir.listdir()) \
+            == [saved_file, 'words.txt']
+
+    def test_serve_lines(self, expected):
+        """Each line of input gets one line of result."""
+        output = io.StringIO()
+        permutations.serve_lines(permutations.make_finder('trie'),
+                                 io.StringIO('house\nxyz\n'), output)
+        assert [json.loads(line) for line in output.getvalue().splitlines()] \
+            == [{'letters': 'house', 'words': expected['house']},
+                {'letters': 'xyz', 'words': []}]
+
+    def test_server(self, expected):
+        """Queries are answered on TCP port."""
+        server = permutations.QueryServer(0, permutations.make_finder())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = socket.create_connection(server.server_address)
+            with client, client.makefile('rwb') as stream:
+                for letters in self.QUERIES:
+                    stream.write(letters.encode('utf-8') + b'\n')
+                    stream.flush()
+                    assert json.loads(stream.readline().decode('utf-8')) \
+                        == {'letters': letters, 'words': expected[letters]}
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -2,43 +2,159 @@
 
 # This program will calculate quality of work of a classifier.
 
+import argparse
+import collections
+import itertools
+import multiprocessing
 import os
+import re
 import sys
+import tempfile
 
 import numpy as np
-from sklearn.metrics import roc_auc_score
 
 # round float up to this number of characters after decimal point.
 round_chars = 5
 
+# default number of lines read at once in streaming mode.
+default_chunk_size = 1000000
+
+# confusion matrix with more cells keeps only not empty cells.
+dense_cells_limit = 10 ** 6
+
 
 def usage():
     """Print usage."""
-    print (
+    print((
         "\n{delim}\n"
         "\nThis program will calculate quality of work of a classifier.\n"
         "Usage:\n"
-        "\t{file} file1 file2\n"
+        "\t{file} file1 file2 [--chunk-size N]\n"
+        "\t{file} --answers file2 file1 [file1 ...] [--jobs N]\n"
+        "\t{file} --online [--batch-size N] [--decay D | --window W]\n"
+        "\t{file} --multiclass|--multilabel file1 file2 [--per-class]\n"
         "Where:\n"
         "\tfile1 - File with test samples.\n"
         "\tfile2 - File with correct answers for provided sample.\n"
+        "\t--chunk-size - Read files by N lines instead of loading\n"
+        "\t               them into memory (for huge files).\n"
+        "\t--no-cache   - Do not read/write binary cache of parsed files\n"
+        "\t               (.<file>.<size>.<mtime>.npy next to the file).\n"
+        "\t--answers    - Batch mode: score all files with test samples\n"
+        "\t               against one file with correct answers.\n"
+        "\t--jobs       - Number of processes for batch mode.\n"
+        "\t--curves     - Save ROC and Precision-Recall curves to CSV.\n"
+        "\t--curve-points - Max number of points in saved curves.\n"
+        "\t--objective  - Also print best threshold for objective (may be\n"
+        "\t               repeated): roc_auc, f1, youden, accuracy,\n"
+        "\t               precision_at_recall:R, cost:FN_COST.\n"
+        "\t--bootstrap  - Print confidence intervals of metrics counted\n"
+        "\t               with N bootstrap samples.\n"
+        "\t--confidence - Confidence level of intervals (0.95).\n"
+        "\t--bootstrap-refit - Choose threshold again in each sample.\n"
+        "\t--seed       - Random seed for bootstrap.\n"
+        "\t--online     - Read lines 'sample,answer' from stdin and print\n"
+        "\t               best threshold after each batch of N lines.\n"
+        "\t--decay      - Online: multiply old counts by D on each batch.\n"
+        "\t--window     - Online: keep only W last batches.\n"
+        "\t--multiclass - file1 has predicted class (or scores of all\n"
+        "\t               classes) in each line, file2 - correct class.\n"
+        "\t--multilabel - file1 has scores of all labels in each line,\n"
+        "\t               file2 - correct answers (1 or 0) of all labels.\n"
+        "\t--threshold  - Multilabel: threshold of scores (0.5).\n"
+        "\t--per-class  - Print metrics of each class.\n"
         "For example:\n"
         "{file} ./data/LogisticRegression_pred.csv ./data/test_labels.csv\n"
         "{file} ./data/NaiveBayes_pred.csv ./data/test_labels.csv\n"
+        "{file} --answers ./data/test_labels.csv ./data/*_pred.csv\n"
         "\n{delim}\n"
-    ).format(delim='-' * 40, file=__file__)
+    ).format(delim='-' * 40, file=__file__))
 
 
 def get_args():
     """Get args. Assume first arg is samples. Second- answers.
 
-    :return: Dict with file names.
+    In batch mode (--answers) all args are files with samples.
+
+    :return: Dict with file names and options.
     """
-    args = sys.argv[1:]
-    if len(args) == 0:
+    if len(sys.argv[1:]) == 0:
         usage()
         raise ValueError('Please provide two files')
-    return {'samples_file': args[0], 'answers_file': args[1]}
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--answers', dest='answers_file', default=None)
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false')
+    parser.add_argument('--curves', dest='curves_file', default=None)
+    parser.add_argument('--curve-points', type=int, default=None)
+    parser.add_argument('--objective', dest='objectives', action='append',
+                        default=[])
+    parser.add_argument('--bootstrap', type=int, default=None)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--bootstrap-refit', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--online', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    forgetting = parser.add_mutually_exclusive_group()
+    forgetting.add_argument('--decay', type=float, default=None)
+    forgetting.add_argument('--window', type=int, default=None)
+    parser.add_argument('--multiclass', action='store_true')
+    parser.add_argument('--multilabel', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--per-class', action='store_true')
+    args = vars(parser.parse_args())
+
+    if args['online']:
+        if args['files']:
+            parser.error('--online reads samples and answers from stdin')
+        return args
+
+    binary_only = any((args['answers_file'], args['chunk_size'],
+                       args['curves_file'], args['objectives'],
+                       args['bootstrap']))
+    if (args['multiclass'] or args['multilabel']) and binary_only:
+        parser.error('--multiclass and --multilabel can be used only with '
+                     'two files')
+
+    in_memory_only = any((args['curves_file'], args['objectives'],
+                          args['bootstrap']))
+    if in_memory_only and (args['answers_file'] or args['chunk_size']):
+        parser.error('--curves, --objective and --bootstrap can not be used '
+                     'with --answers/--chunk-size')
+    try:
+        args['objectives'] = dict((spec, get_objective(spec))
+                                  for spec in args['objectives'])
+    except ValueError as e:
+        parser.error(str(e))
+
+    args['batch'] = args['answers_file'] is not None
+    if args['batch']:
+        if args['chunk_size']:
+            parser.error('--chunk-size can not be used with --answers')
+        if not args['files']:
+            parser.error('Please provide files with samples')
+        args['samples_files'] = args['files']
+    else:
+        if len(args['files']) != 2:
+            usage()
+            raise ValueError('Please provide two files')
+        args['samples_file'], args['answers_file'] = args['files']
+    return args
+
+
+def _to_float(line):
+    """Convert one line of file to float.
+
+    :raise: ValueError if line is not a number.
+    """
+    num = line.strip('\n')
+    try:
+        return float(num)
+    except Exception:
+        raise ValueError('Input is not a number: %s' % num)
 
 
 def parse_file(file_path):
@@ -50,72 +166,187 @@ def parse_file(file_path):
     assert os.path.isfile(file_path), (
         'File [{0}] not exists'.format(file_path))
 
-    results = []
     with open(file_path, 'r') as f:
-        for line in f.readlines():
-            num = line.strip('\n')
-            try:
-                num = float(num)
-            except Exception:
-                raise ValueError('Input is not a number: %s' % num)
-            results.append(num)
-    return results
+        return [_to_float(line) for line in f]
+
+
+def _cache_path(file_path):
+    """Return path to binary cache of file. It depends on size and mtime.
+
+    :param file_path: Path to file with number-values.
+    :return: Path like: ./data/.test_labels.csv.2223096.1492000000000.npy
+    """
+    stat = os.stat(file_path)
+    mtime = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 10 ** 9))
+    dir_name, file_name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(dir_name, '.{name}.{size}.{mtime}.npy'.format(
+        name=file_name, size=stat.st_size, mtime=mtime))
+
+
+def _write_cache(file_path, values):
+    """Save parsed values next to file. Old caches of file are removed.
+
+    Errors are ignored: cache is only an optimization.
+    """
+    cache_path = _cache_path(file_path)
+    dir_name, cache_name = os.path.split(cache_path)
+    # only caches of this file, not of files like '<file>.bak'
+    is_cache = re.compile(r'\.{0}\.\d+\.\d+\.npy$'.format(
+        re.escape(os.path.basename(file_path)))).match
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=cache_name)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, values)
+        os.rename(tmp_path, cache_path)
+        for name in os.listdir(dir_name):
+            if is_cache(name) and name != cache_name:
+                os.remove(os.path.join(dir_name, name))
+    except (IOError, OSError):
+        pass
+
+
+def _count_lines(file_path):
+    """Count lines of file like iteration over it does.
+
+    :param file_path: Path to file.
+    :return: Number of lines (last one may be without line break).
+    """
+    count = 0
+    last = b'\n'
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            count += block.count(b'\n')
+            last = block[-1:]
+    return count + (last != b'\n')
+
+
+def load_file(file_path, use_cache=True):
+    """Read file with number-values in it as fast as possible.
+
+    Whole file is parsed by numpy. If it fails (or skips empty lines) -
+    file is parsed line by line to report wrong line. Parsed array is
+    saved to binary cache and next time it is memory-mapped instead of
+    parsing.
+
+    :param file_path: Path to file for parsing.
+    :param use_cache: Read and write binary cache.
+    :return: Numpy array of floats.
+    """
+    assert os.path.isfile(file_path), (
+        'File [{0}] not exists'.format(file_path))
+
+    if use_cache:
+        cache_path = _cache_path(file_path)
+        if os.path.isfile(cache_path):
+            return np.load(cache_path, mmap_mode='r')
+
+    try:
+        values = np.loadtxt(file_path, dtype=np.float64,
+                            comments=None, ndmin=1)
+    except ValueError:
+        values = None
+    # numpy skips empty lines, parse_file reports them as wrong
+    if values is None or values.ndim != 1 \
+            or values.size != _count_lines(file_path):
+        values = np.array(parse_file(file_path), dtype=np.float64)
+
+    if use_cache:
+        _write_cache(file_path, values)
+    return values
+
+
+def iter_file_chunks(file_path, chunk_size=default_chunk_size,
+                     use_cache=True):
+    """Read file by chunks. Only one chunk is kept in memory.
+
+    If binary cache of file exists - chunks are slices of memory-mapped
+    cache.
+
+    :param file_path: Path to file for parsing.
+    :param chunk_size: Max number of lines in one chunk.
+    :param use_cache: Read binary cache if it exists.
+    :return: Generator of numpy arrays with floats.
+    """
+    assert os.path.isfile(file_path), (
+        'File [{0}] not exists'.format(file_path))
+
+    if use_cache and os.path.isfile(_cache_path(file_path)):
+        values = np.load(_cache_path(file_path), mmap_mode='r')
+        for start in range(0, values.size, chunk_size):
+            yield np.asarray(values[start:start + chunk_size])
+        return
+
+    with open(file_path, 'r') as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            yield np.fromiter((_to_float(line) for line in lines),
+                              dtype=np.float64, count=len(lines))
 
 
 def convert_to_bin(num_list, threshold=0.6):
     """Round list of floats.
 
-    :param num_list: List of floats.
+    :param num_list: List (or numpy array) of floats.
     :param threshold: Threshold to count float is 1 or 0.
-    :return: List of floats.
+    :return: Numpy array of floats (1.0 or 0.0).
     """
-    rounded = []
-    for one in num_list:
-        if one > threshold:
-            rounded.append(1.0)
-        else:
-            rounded.append(0.0)
-    return rounded
+    return binarize(num_list, threshold).astype(np.float64)
+
+
+def binarize(num_list, threshold=0.6):
+    """Compare every float with threshold.
+
+    :param num_list: List (or numpy array) of floats.
+    :param threshold: Threshold to count float is 1 or 0.
+    :return: Numpy array of booleans.
+    """
+    return np.asarray(num_list, dtype=np.float64) > threshold
 
 
 def get_results(samples, answers):
     """Return dict with type of error and it's count.
 
-    :param samples: List with samples
-    :param answers: List with correct answers.
+    :param samples: List (or numpy array) with samples
+    :param answers: List (or numpy array) with correct answers.
     :return: Dict like:
     :   {'FN': 4744.0, 'FP': 573.0, 'TN': 72267.0, 'TP': 292932.0}
     """
-    tp = 0.0  # True Positive    sampl= 1 ; answ= 1
-    fp = 0.0  # False Positive   sampl= 1 ; answ= 0
-    fn = 0.0  # False Negative   sampl= 0 ; answ= 1
-    tn = 0.0  # True Negative    sampl= 0 ; answ= 0
+    samples = np.asarray(samples, dtype=np.float64)
+    answers = np.asarray(answers, dtype=np.float64)
+
+    same = samples == answers
+    positive = answers > 0
 
-    for sample, answer in zip(samples, answers):
-        if sample == answer:
-            if answer > 0:
-                tp += 1
-            else:
-                tn += 1
-        if sample != answer:
-            if answer > 0:
-                fn += 1
-            else:
-                fp += 1
+    tp = np.count_nonzero(same & positive)   # sampl= 1 ; answ= 1
+    tn = np.count_nonzero(same) - tp         # sampl= 0 ; answ= 0
+    fn = np.count_nonzero(positive) - tp     # sampl= 0 ; answ= 1
+    fp = answers.size - tp - tn - fn         # sampl= 1 ; answ= 0
 
-    return {'TP': tp, 'FP': fp, 'FN': fn, 'TN': tn}
+    return {'TP': float(tp), 'FP': float(fp), 'FN': float(fn), 'TN': float(tn)}
+
+
+def _ratio(numerator, denominator):
+    """Divide and round. Works with numbers and numpy arrays.
+
+    :return: num or numpy array. nan if denominator is 0.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round(
+            np.true_divide(numerator, denominator), round_chars)
 
 
 def count_precision(tp, fp):
-    return round((tp / (tp + fp)), round_chars)
+    return _ratio(tp, tp + fp)
 
 
 def count_recall(tp, fn):
-    return round((tp / (tp + fn)), round_chars)
+    return _ratio(tp, tp + fn)
 
 
 def count_harmonic_mean(precision, recall):
-    return round((2 * precision * recall) / (precision + recall), round_chars)
+    return _ratio(2 * precision * recall, precision + recall)
 
 
 def count_fpr(fp, tn):
@@ -125,7 +356,7 @@ def count_fpr(fp, tn):
     :param tn: num of True Negative.
     :return: num
     """
-    return round((fp / (fp + tn)), round_chars)
+    return _ratio(fp, fp + tn)
 
 
 def count_tpr(tp, fn):
@@ -135,19 +366,39 @@ def count_tpr(tp, fn):
     :param fn: num of False Negative.
     :return: Num
     """
-    return round((tp / (tp + fn)), round_chars)
+    return _ratio(tp, tp + fn)
 
 
-def get_answers_and_samples():
+def compute_metrics(results):
+    """Count all metrics from dict with errors.
+
+    :param results: Dict from get_results (or sweep_thresholds). Values
+                    may be numbers or numpy arrays.
+    :return: Dict like:
+    :   {'precision': 0.99805, 'recall': 0.98407, 'harmonic_mean': 0.99101,
+    :    'tpr': 0.98407, 'fpr': 0.00787}
+    """
+    tp, fp, fn, tn = [np.asarray(results[key], dtype=np.float64)
+                      for key in ('TP', 'FP', 'FN', 'TN')]
+    precision = count_precision(tp=tp, fp=fp)
+    recall = count_recall(tp=tp, fn=fn)
+    return {'precision': precision,
+            'recall': recall,
+            'harmonic_mean': count_harmonic_mean(precision, recall),
+            'tpr': count_tpr(tp=tp, fn=fn),
+            'fpr': count_fpr(fp=fp, tn=tn)}
+
+
+def get_answers_and_samples(args=None):
     """Read and return floats from files.
 
-    :return: Two list of floats: samples, answers
+    :param args: Dict from get_args. It is read from argv if not provided.
+    :return: Two numpy arrays of floats: samples, answers
     """
-    sample_file = get_args()['samples_file']
-    answer_file = get_args()['answers_file']
+    args = args or get_args()
 
-    samples = parse_file(sample_file)
-    answers = parse_file(answer_file)
+    samples = load_file(args['samples_file'], use_cache=args['use_cache'])
+    answers = load_file(args['answers_file'], use_cache=args['use_cache'])
 
     assert len(samples) == len(answers), (
         "Number of samples is not equal to the number of answers")
@@ -155,53 +406,1078 @@ def get_answers_and_samples():
     return samples, answers
 
 
-def convert_with_best_threshold():
+def iter_answers_and_samples(samples_file, answers_file,
+                             chunk_size=default_chunk_size, use_cache=True):
+    """Read both files in lockstep, chunk by chunk.
+
+    :return: Generator of pairs of numpy arrays: samples, answers
+    """
+    error = "Number of samples is not equal to the number of answers"
+    answers_chunks = iter_file_chunks(answers_file, chunk_size, use_cache)
+    for samples in iter_file_chunks(samples_file, chunk_size, use_cache):
+        answers = next(answers_chunks, None)
+        assert answers is not None and samples.size == answers.size, error
+        yield samples, answers
+    assert next(answers_chunks, None) is None, error
+
+
+def stream_results(samples_file, answers_file, threshold,
+                   chunk_size=default_chunk_size, use_cache=True):
+    """Count errors like get_results, but read files chunk by chunk.
+
+    :param threshold: Threshold to convert samples to bin.
+    :return: Dict like:
+    :   {'FN': 4744.0, 'FP': 573.0, 'TN': 72267.0, 'TP': 292932.0}
+    """
+    totals = {'TP': 0.0, 'FP': 0.0, 'FN': 0.0, 'TN': 0.0}
+    for samples, answers in iter_answers_and_samples(
+            samples_file, answers_file, chunk_size, use_cache):
+        results = get_results(convert_to_bin(samples, threshold=threshold),
+                              convert_to_bin(answers))
+        for key in totals:
+            totals[key] += results[key]
+    return totals
+
+
+def stream_sweep(samples_file, answers_file, thresholds=None,
+                 chunk_size=default_chunk_size, use_cache=True):
+    """Count errors like sweep_thresholds, but read files chunk by chunk.
+
+    For each class only a histogram of samples between neighbour
+    thresholds is kept, so memory does not depend on size of files.
+
+    :param thresholds: Thresholds to check. 0.01 ... 0.99 by default.
+    :return: Dict like in sweep_thresholds.
+    """
+    if thresholds is None:
+        thresholds = default_thresholds()
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    order = np.argsort(thresholds, kind='mergesort')
+    sorted_thresholds = thresholds[order]
+
+    pos_hist = np.zeros(thresholds.size + 1, dtype=np.int64)
+    neg_hist = np.zeros(thresholds.size + 1, dtype=np.int64)
+    for samples, answers in iter_answers_and_samples(
+            samples_file, answers_file, chunk_size, use_cache):
+        chunk_pos, chunk_neg = _histograms(
+            samples, binarize(answers), sorted_thresholds)
+        pos_hist += chunk_pos
+        neg_hist += chunk_neg
+
+    tp = np.empty(thresholds.size, dtype=np.int64)
+    fp = np.empty(thresholds.size, dtype=np.int64)
+    tp[order] = _above(pos_hist)
+    fp[order] = _above(neg_hist)
+
+    total_pos = pos_hist.sum()
+    return _sweep_results(thresholds, tp, fp,
+                          total_pos=total_pos,
+                          total=total_pos + neg_hist.sum())
+
+
+def _histograms(samples, labels, sorted_thresholds):
+    """Count positive and negative samples between neighbour thresholds.
+
+    Bin k - samples which are greater than k smallest thresholds only.
+
+    :param samples: Numpy array of floats.
+    :param labels: Numpy array of booleans.
+    :param sorted_thresholds: Numpy array of thresholds (ascending).
+    :return: Two numpy arrays: positive histogram, negative histogram.
+    """
+    bins_num = sorted_thresholds.size + 1
+    bins = np.searchsorted(sorted_thresholds, samples, side='left')
+    return (np.bincount(bins[labels], minlength=bins_num),
+            np.bincount(bins[~labels], minlength=bins_num))
+
+
+def _above(hist):
+    """Count samples greater than each threshold from histogram.
+
+    Samples from bins after k are greater than k-th threshold.
+    Works along the last axis, so many histograms can be passed at once.
+    """
+    return np.cumsum(hist[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+
+
+def _sorted_index(samples, labels):
+    """Sort samples once and count positive answers cumulatively.
+
+    :param samples: Sequence of float scores.
+    :param labels: Sequence of booleans (correct answers).
+    :return: sorted scores (ascending), cumulative number of positive
+             answers (cum_pos[i] - positives among first i scores).
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    order = np.argsort(samples, kind='mergesort')
+    sorted_scores = samples[order]
+    cum_pos = np.zeros(sorted_scores.size + 1, dtype=np.int64)
+    np.cumsum(labels[order], out=cum_pos[1:])
+    return sorted_scores, cum_pos
+
+
+def _distinct(sorted_scores):
+    """Return distinct values of already sorted array."""
+    is_new = np.empty(sorted_scores.size, dtype=bool)
+    is_new[:1] = True
+    np.not_equal(sorted_scores[1:], sorted_scores[:-1], out=is_new[1:])
+    return sorted_scores[is_new]
+
+
+def _sweep_results(thresholds, tp, fp, total_pos, total):
+    """Build dict with TP/FP/FN/TN arrays from positive predictions.
+
+    :param thresholds: Array of thresholds.
+    :param tp: Array with number of True Positive for each threshold.
+    :param fp: Array with number of False Positive for each threshold.
+    :param total_pos: Number of positive answers.
+    :param total: Number of all answers.
+    :return: Dict like in sweep_thresholds.
+    """
+    fn = total_pos - tp
+    tn = (total - total_pos) - fp
+    return {'threshold': thresholds,
+            'TP': tp.astype(np.float64),
+            'FP': fp.astype(np.float64),
+            'FN': fn.astype(np.float64),
+            'TN': tn.astype(np.float64)}
+
+
+class ScoreIndex(object):
+    """Samples sorted once together with cumulative count of positives.
+
+    Any number of thresholds, objectives and curves is counted from it
+    without sorting samples again.
+    """
+
+    def __init__(self, samples, labels):
+        """Sort samples.
+
+        :param samples: Sequence of float scores.
+        :param labels: Sequence of booleans (correct answers).
+        """
+        self.sorted_scores, self.cum_pos = _sorted_index(samples, labels)
+        self.total = self.sorted_scores.size
+        self.total_pos = self.cum_pos[-1]
+        self._distinct_sweep = None
+
+    def sweep(self, thresholds=None):
+        """Count TP/FP/FN/TN for thresholds.
+
+        :param thresholds: Thresholds to check. All distinct sample values
+                           and -inf (every sample is positive) are used
+                           if not provided.
+        :return: Dict like in sweep_thresholds.
+        """
+        if thresholds is None:
+            if self._distinct_sweep is None:
+                self._distinct_sweep = self.sweep(self.distinct_thresholds())
+            return dict(self._distinct_sweep)
+
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        # number of samples which are less or equal to threshold
+        below = np.searchsorted(self.sorted_scores, thresholds, side='right')
+        tp = self.total_pos - self.cum_pos[below]
+        fp = (self.total - below) - tp
+        return _sweep_results(thresholds, tp, fp,
+                              self.total_pos, self.total)
+
+    def distinct_thresholds(self):
+        """Return -inf and all distinct sample values (ascending).
+
+        Together they give every possible split of samples.
+        """
+        return np.concatenate(([-np.inf], _distinct(self.sorted_scores)))
+
+    def select(self, objectives, thresholds=None):
+        """Find best threshold for each objective.
+
+        :param objectives: Dict like {name: objective function}.
+        :param thresholds: Thresholds to check. All distinct sample values
+                           and -inf are used if not provided.
+        :return: Dict like {name: dict from select_threshold or None}.
+        """
+        sweep = self.sweep(thresholds)
+        return dict((name, select_threshold(sweep, objective))
+                    for name, objective in objectives.items())
+
+    def curves(self, max_points=None):
+        """Count ROC and Precision-Recall curves and their areas.
+
+        See compute_curves.
+        """
+        sweep = self.sweep(self.distinct_thresholds()[::-1])
+        tp, fp, fn, tn = sweep['TP'], sweep['FP'], sweep['FN'], sweep['TN']
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fpr = fp / (fp + tn)
+            tpr = tp / (tp + fn)
+            precision = tp / (tp + fp)
+        roc_auc = np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)
+        pr_auc = np.sum(np.diff(tpr) * precision[1:])
+
+        curves = {'threshold': sweep['threshold'],
+                  'fpr': count_fpr(fp=fp, tn=tn),
+                  'tpr': count_tpr(tp=tp, fn=fn),
+                  'precision': count_precision(tp=tp, fp=fp),
+                  'recall': count_recall(tp=tp, fn=fn),
+                  'roc_auc': round(float(roc_auc), round_chars),
+                  'pr_auc': round(float(pr_auc), round_chars)}
+        return _downsample(curves, max_points)
+
+
+def sweep_thresholds(samples, labels, thresholds=None):
+    """Count TP/FP/FN/TN for many thresholds with a single sort.
+
+    Sample is treated as positive if it is greater than threshold
+    (the same rule as in convert_to_bin).
+
+    :param samples: Sequence of float scores.
+    :param labels: Sequence of booleans (correct answers).
+    :param thresholds: Thresholds to check. All distinct sample values
+                       and -inf are used if not provided.
+    :return: Dict with numpy arrays (one value per threshold) like:
+    :   {'threshold': [...], 'TP': [...], 'FP': [...], 'FN': [...],
+    :    'TN': [...]}
+    """
+    return ScoreIndex(samples, labels).sweep(thresholds)
+
+
+def count_binary_roc_auc(tp, fp, fn, tn):
+    """Count ROC AUC of already binarized samples.
+
+    It is what roc_auc_score returns for 0/1 samples: (TPR + TNR) / 2.
+
+    :return: num or numpy array.
+    """
+    tp, fp, fn, tn = [np.asarray(x, dtype=np.float64)
+                      for x in (tp, fp, fn, tn)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round((tp / (tp + fn) + tn / (tn + fp)) / 2, round_chars)
+
+
+def _rates(sweep):
+    """Return not rounded TPR, FPR and precision of a sweep."""
+    tp, fp, fn, tn = sweep['TP'], sweep['FP'], sweep['FN'], sweep['TN']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return tp / (tp + fn), fp / (fp + tn), tp / (tp + fp)
+
+
+def objective_roc_auc(sweep):
+    """ROC AUC of binarized samples rounded to round_chars (default)."""
+    return count_binary_roc_auc(
+        sweep['TP'], sweep['FP'], sweep['FN'], sweep['TN'])
+
+
+def objective_f1(sweep):
+    """Harmonic mean of Precision and Recall."""
+    tpr, _, precision = _rates(sweep)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 2 * precision * tpr / (precision + tpr)
+
+
+def objective_youden(sweep):
+    """Youden's J statistic: TPR - FPR."""
+    tpr, fpr, _ = _rates(sweep)
+    return tpr - fpr
+
+
+def objective_accuracy(sweep):
+    """Share of right answers."""
+    right = sweep['TP'] + sweep['TN']
+    return right / (right + sweep['FP'] + sweep['FN'])
+
+
+def precision_at_recall(min_recall):
+    """Make objective: max Precision while Recall >= min_recall."""
+    def objective(sweep):
+        tpr, _, precision = _rates(sweep)
+        return np.where(tpr >= min_recall, precision, -np.inf)
+    return objective
+
+
+def cost_weighted(fn_cost=1.0):
+    """Make objective: min cost of errors, FN costs fn_cost FP."""
+    def objective(sweep):
+        return -(sweep['FP'] + fn_cost * sweep['FN'])
+    return objective
+
+
+# Objective name -> (objective or function which makes it from a number).
+OBJECTIVES = {
+    'roc_auc': (objective_roc_auc, False),
+    'f1': (objective_f1, False),
+    'youden': (objective_youden, False),
+    'accuracy': (objective_accuracy, False),
+    'precision_at_recall': (precision_at_recall, True),
+    'cost': (cost_weighted, True),
+}
+
+
+def get_objective(spec):
+    """Get objective by its name like: 'f1', 'precision_at_recall:0.95'.
+
+    :param spec: Objective name and optional number after ':'.
+    :return: Function: sweep -> array of scores (bigger is better).
+    :raise: ValueError if objective is unknown or number is wrong.
+    """
+    name, _, param = spec.partition(':')
+    if name not in OBJECTIVES:
+        raise ValueError('Unknown objective: {0}. Use one of: {1}'.format(
+            name, ', '.join(sorted(OBJECTIVES))))
+    objective, with_param = OBJECTIVES[name]
+    if not with_param:
+        if param:
+            raise ValueError('Objective {0} has no parameter'.format(name))
+        return objective
+    if not param:
+        return objective()
+    try:
+        return objective(float(param))
+    except ValueError:
+        raise ValueError('Parameter is not a number: %s' % spec)
+
+
+def select_threshold(sweep, objective=objective_roc_auc):
+    """Choose threshold with max score of objective.
+
+    If several thresholds have the same score - the biggest one is taken.
+    Thresholds with undefined score (nan) or with score -inf (condition
+    of objective is not met) are never taken.
+
+    :param sweep: Dict from sweep_thresholds or stream_sweep.
+    :param objective: Function: sweep -> array of scores.
+    :return: Dict like {'threshold': 0.53, 'score': 0.99, 'TP': ...}
+             with counts of errors and all metrics for this threshold.
+             None if no threshold can be taken.
+    """
+    scores = np.asarray(objective(sweep), dtype=np.float64)
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    if not scores.size or scores.max() == -np.inf:
+        return None
+    tied = np.flatnonzero(scores == scores.max())
+    best = tied[np.argmax(sweep['threshold'][tied])]
+
+    row = dict((key, sweep[key][best]) for key in ('TP', 'FP', 'FN', 'TN'))
+    row.update(compute_metrics(row))
+    row['threshold'] = float(sweep['threshold'][best])
+    row['score'] = float(scores[best])
+    return row
+
+
+def default_thresholds():
+    """Return thresholds which are checked by default: 0.01 ... 0.99."""
+    return np.arange(0.01, 1.00, 0.01)
+
+
+def find_best_threshold(samples, labels, thresholds=None):
+    """Find threshold with max ROC AUC of binarized samples.
+
+    If several thresholds have the same score - the biggest one is taken.
+
+    :param samples: Sequence of float scores.
+    :param labels: Sequence of booleans (correct answers).
+    :param thresholds: Thresholds to check. 0.01 ... 0.99 by default.
+    :return: best threshold, dict from sweep_thresholds with
+             'score' array added.
+    """
+    if thresholds is None:
+        thresholds = default_thresholds()
+    return choose_best_threshold(
+        sweep_thresholds(samples, labels, thresholds))
+
+
+def choose_best_threshold(sweep):
+    """Choose threshold with max ROC AUC from results of a sweep.
+
+    :param sweep: Dict from sweep_thresholds or stream_sweep.
+    :return: best threshold, sweep with 'score' array added.
+    :raise: ValueError if ROC AUC is not defined (answers have one class).
+    """
+    sweep['score'] = objective_roc_auc(sweep)
+    best = select_threshold(sweep, objective_roc_auc)
+    if best is None:
+        raise ValueError('ROC AUC is not defined: all answers are the same')
+    return round(best['threshold'], 2), sweep
+
+
+def _downsample(curves, max_points):
+    """Keep only max_points evenly spaced points of curves (with ends)."""
+    size = curves['threshold'].size
+    if not max_points or size <= max_points:
+        return curves
+    keep = np.unique(np.linspace(0, size - 1, max_points).round()
+                     .astype(np.int64))
+    for key in ('threshold', 'fpr', 'tpr', 'precision', 'recall'):
+        curves[key] = curves[key][keep]
+    return curves
+
+
+def compute_curves(samples, labels, max_points=None):
+    """Count ROC and Precision-Recall curves and their areas.
+
+    Samples are sorted once and every distinct sample value is used as
+    threshold, so curves and areas are exact.
+    ROC AUC is counted with trapezoidal rule, PR AUC is average precision
+    (sum of precisions weighted by increase of recall).
+
+    :param samples: Sequence of float scores.
+    :param labels: Sequence of booleans (correct answers).
+    :param max_points: Max number of points of curves to return.
+                       Areas are always counted with all points.
+    :return: Dict like (points go from the biggest threshold):
+    :   {'threshold': [...], 'fpr': [...], 'tpr': [...],
+    :    'precision': [...], 'recall': [...],
+    :    'roc_auc': 0.99812, 'pr_auc': 0.99935}
+    """
+    return ScoreIndex(samples, labels).curves(max_points)
+
+
+def _bootstrap_worker(params):
+    """Count metrics for part of bootstrap samples.
+
+    Resampling N rows with replacement is the same as drawing counts of
+    rows in each cell (class x bin between thresholds) from multinomial
+    distribution, so one bootstrap sample costs O(number of cells).
+
+    :param params: Tuple: probabilities of cells (positive bins, then
+                   negative bins), number of rows, sorted thresholds,
+                   number of bootstrap samples, random seed.
+    :return: Dict with metric name -> numpy array (one value per sample).
+    """
+    probabilities, total, thresholds, iterations, seed = params
+    random = np.random.RandomState(seed)
+    counts = random.multinomial(total, probabilities, size=iterations)
+
+    bins_num = thresholds.size + 1
+    pos_hist, neg_hist = counts[:, :bins_num], counts[:, bins_num:]
+    total_pos = pos_hist.sum(axis=1)[:, np.newaxis]
+    tp, fp = _above(pos_hist), _above(neg_hist)
+    fn, tn = total_pos - tp, (total - total_pos) - fp
+
+    # threshold is chosen again for each sample if there are many of them
+    scores = count_binary_roc_auc(tp, fp, fn, tn)
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    best = thresholds.size - 1 - np.argmax(scores[:, ::-1], axis=1)
+
+    rows = np.arange(iterations)
+    metrics = compute_metrics({'TP': tp[rows, best], 'FP': fp[rows, best],
+                               'FN': fn[rows, best], 'TN': tn[rows, best]})
+    metrics['threshold'] = thresholds[best]
+    return metrics
+
+
+def bootstrap_metrics(samples, labels, threshold, iterations=1000,
+                      confidence=0.95, refit=False, jobs=None, seed=None):
+    """Count bootstrap confidence intervals of all metrics.
+
+    :param samples: Sequence of float scores.
+    :param labels: Sequence of booleans (correct answers).
+    :param threshold: Threshold to convert samples to bin.
+    :param iterations: Number of bootstrap samples.
+    :param confidence: Confidence level of intervals.
+    :param refit: Choose best threshold (0.01 ... 0.99) again in each
+                  bootstrap sample instead of using threshold.
+    :param jobs: Number of processes. One by default.
+    :param seed: Random seed.
+    :return: Dict like:
+    :   {'precision': (0.99601, 0.99698), 'recall': (0.97509, 0.97611),
+    :    ..., 'threshold': (0.99, 0.99)}
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    thresholds = np.sort(default_thresholds()) if refit else np.array(
+        [threshold], dtype=np.float64)
+
+    pos_hist, neg_hist = _histograms(samples, labels, thresholds)
+    probabilities = np.concatenate((pos_hist, neg_hist)) / float(samples.size)
+
+    jobs = max(1, min(jobs or 1, iterations))
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=jobs)
+    params = [(probabilities, samples.size, thresholds, part.size, part_seed)
+              for part, part_seed in zip(
+                  np.array_split(np.arange(iterations), jobs), seeds)]
+
+    if jobs == 1:
+        parts = list(map(_bootstrap_worker, params))
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            parts = pool.map(_bootstrap_worker, params)
+        finally:
+            pool.terminate()
+
+    tail = (1 - confidence) / 2 * 100
+    intervals = {}
+    for key in parts[0]:
+        values = np.concatenate([part[key] for part in parts])
+        low, high = np.nanpercentile(values, [tail, 100 - tail])
+        intervals[key] = (round(float(low), round_chars),
+                          round(float(high), round_chars))
+    return intervals
+
+
+class OnlineEvaluator(object):
+    """Quality of a classifier counted incrementally.
+
+    Only histograms of samples between thresholds are kept for each class,
+    so adding a batch costs O(batch) and best threshold with metrics is
+    found in O(number of thresholds) at any moment.
+    Old batches may be forgotten: with decay all kept counts are
+    multiplied by it before each new batch, with window only last
+    batches are kept. Only one of them can be used.
+    """
+
+    def __init__(self, thresholds=None, decay=None, window=None):
+        """Create empty evaluator.
+
+        :param thresholds: Thresholds to check. 0.01 ... 0.99 by default.
+        :param decay: Multiplier of old counts (0 < decay <= 1).
+        :param window: Number of last batches to keep.
+        """
+        if thresholds is None:
+            thresholds = default_thresholds()
+        assert decay is None or 0 < decay <= 1, 'Decay must be in (0, 1]'
+        assert window is None or window > 0, 'Window must be positive'
+        assert decay is None or window is None, (
+            'Decay and window can not be used together')
+
+        self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+        self.decay = decay
+        self.window = window
+        self.pos_hist = np.zeros(self.thresholds.size + 1, dtype=np.float64)
+        self.neg_hist = np.zeros(self.thresholds.size + 1, dtype=np.float64)
+        self._batches = collections.deque()
+
+    def update(self, samples, answers):
+        """Add batch of samples with correct answers.
+
+        :param samples: Sequence of float scores.
+        :param answers: Sequence of correct answers.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        assert samples.size == len(answers), (
+            "Number of samples is not equal to the number of answers")
+        pos_hist, neg_hist = _histograms(
+            samples, binarize(answers), self.thresholds)
+
+        if self.decay is not None:
+            self.pos_hist *= self.decay
+            self.neg_hist *= self.decay
+        self.pos_hist += pos_hist
+        self.neg_hist += neg_hist
+
+        if self.window is not None:
+            self._batches.append((pos_hist, neg_hist))
+            if len(self._batches) > self.window:
+                old_pos, old_neg = self._batches.popleft()
+                self.pos_hist -= old_pos
+                self.neg_hist -= old_neg
+
+    @property
+    def total(self):
+        """Number (or decayed weight) of kept samples."""
+        return self.pos_hist.sum() + self.neg_hist.sum()
+
+    def sweep(self):
+        """Count TP/FP/FN/TN for all thresholds.
+
+        :return: Dict like in sweep_thresholds.
+        """
+        total_pos = self.pos_hist.sum()
+        return _sweep_results(self.thresholds,
+                              _above(self.pos_hist), _above(self.neg_hist),
+                              total_pos, total_pos + self.neg_hist.sum())
+
+    def best(self, objective=objective_roc_auc):
+        """Return current best threshold with its metrics.
+
+        :param objective: Function: sweep -> array of scores.
+        :return: Dict from select_threshold. None while it is not defined
+                 (e.g. all kept answers are the same).
+        """
+        return select_threshold(self.sweep(), objective)
+
+
+def _parse_online_line(line):
+    """Convert line like '0.9998,1' or '0.9998 1' to sample and answer.
+
+    :raise: ValueError if line is wrong.
+    """
+    values = line.replace(',', ' ').split()
+    if len(values) != 2:
+        raise ValueError('Expected sample and answer: %s' % line.strip())
+    return _to_float(values[0]), _to_float(values[1])
+
+
+def run_online(lines, evaluator, batch_size=1000, output=sys.stdout):
+    """Feed evaluator with lines and print best threshold after each batch.
+
+    :param lines: Iterable of lines like '0.9998,1' (sample, answer).
+    :param evaluator: OnlineEvaluator.
+    :param batch_size: Number of lines in one batch.
+    :param output: File to print results to.
+    """
+    template = ('samples={total:.0f} threshold={threshold:.4g} '
+                'precision={precision} recall={recall} f1={harmonic_mean} '
+                'tpr={tpr} fpr={fpr}\n')
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, batch_size))
+        if not chunk:
+            break
+        batch = [_parse_online_line(line) for line in chunk if line.strip()]
+        if not batch:    # only empty lines
+            continue
+        samples, answers = zip(*batch)
+        evaluator.update(samples, answers)
+        best = evaluator.best()
+        if best is None:
+            output.write('samples={0:.0f} threshold is not defined yet\n'
+                         .format(evaluator.total))
+        else:
+            output.write(template.format(total=evaluator.total, **best))
+        output.flush()
+
+
+def load_matrix(file_path):
+    """Read file with many number-values in each line (comma or spaces).
+
+    :param file_path: Path to file for parsing.
+    :return: 2-d numpy array of floats (one row per line).
+    """
+    assert os.path.isfile(file_path), (
+        'File [{0}] not exists'.format(file_path))
+
+    with open(file_path, 'r') as f:
+        delimiter = ',' if ',' in f.readline() else None
+    return np.loadtxt(file_path, dtype=np.float64, delimiter=delimiter,
+                      comments=None, ndmin=2)
+
+
+def _to_classes(values):
+    """Convert array of floats like 3.0 to array of int classes.
+
+    :raise: ValueError if some value is not an integer.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    classes = values.astype(np.int64)
+    if not np.array_equal(classes, values):
+        raise ValueError('Class is not an integer: %s' %
+                         values[classes != values][0])
+    return classes
+
+
+def get_predicted_classes(samples):
+    """Get predicted classes from one class per row or from scores.
+
+    :param samples: Array with class of each row, or matrix with score of
+                    each class (column) in each row.
+    :return: Numpy array of int classes.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 2 and samples.shape[1] > 1:
+        return np.argmax(samples, axis=1)
+    return _to_classes(samples.ravel())
+
+
+class ConfusionMatrix(object):
+    """K x K confusion matrix of multi-class classifier.
+
+    Rows - correct classes, columns - predicted classes. It is counted in
+    one pass with bincount. If matrix has more than dense_cells_limit
+    cells, only not empty cells are kept (rows, cols, counts).
+    """
+
+    def __init__(self, answers, predictions, classes=None, sparse=None):
+        """Count matrix.
+
+        :param answers: Sequence of correct int classes.
+        :param predictions: Sequence of predicted int classes.
+        :param classes: Classes which exist even if they are not met.
+        :param sparse: Keep only not empty cells. By number of cells if None.
+        """
+        answers = _to_classes(answers)
+        predictions = _to_classes(predictions)
+        assert answers.size == predictions.size, (
+            "Number of samples is not equal to the number of answers")
+
+        known = [answers, predictions]
+        if classes is not None:
+            known.append(_to_classes(classes))
+        self.classes = np.unique(np.concatenate(known))
+
+        size = self.classes.size
+        rows = np.searchsorted(self.classes, answers)
+        cols = np.searchsorted(self.classes, predictions)
+        codes = rows * size + cols
+        if sparse is None:
+            sparse = size * size > dense_cells_limit
+        self.sparse = sparse
+        if self.sparse:
+            cells, self.counts = np.unique(codes, return_counts=True)
+            self.rows, self.cols = np.divmod(cells, size)
+            self.matrix = None
+        else:
+            self.matrix = np.bincount(
+                codes, minlength=size * size).reshape(size, size)
+
+    def get_results(self):
+        """Count errors of each class (this class vs all others).
+
+        :return: Dict with numpy arrays (one value per class) like:
+        :   {'class': [...], 'TP': [...], 'FP': [...], 'FN': [...],
+        :    'TN': [...]}
+        """
+        size = self.classes.size
+        if self.sparse:
+            diagonal = self.rows == self.cols
+            tp = np.bincount(self.rows[diagonal],
+                             weights=self.counts[diagonal], minlength=size)
+            real = np.bincount(self.rows, weights=self.counts,
+                               minlength=size)
+            predicted = np.bincount(self.cols, weights=self.counts,
+                                    minlength=size)
+        else:
+            tp = np.diag(self.matrix).astype(np.float64)
+            real = self.matrix.sum(axis=1).astype(np.float64)
+            predicted = self.matrix.sum(axis=0).astype(np.float64)
+
+        fn = real - tp
+        fp = predicted - tp
+        return {'class': self.classes, 'TP': tp, 'FP': fp, 'FN': fn,
+                'TN': real.sum() - tp - fn - fp}
+
+
+def multilabel_results(samples, answers, threshold=0.5):
+    """Count errors of each label of multi-label classifier.
+
+    :param samples: Matrix with score of each label (column) in each row.
+    :param answers: Matrix with correct answers (1 or 0) of same shape.
+    :param threshold: Threshold to convert scores to bin.
+    :return: Dict like in ConfusionMatrix.get_results.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    assert samples.shape == np.shape(answers), (
+        "Shape of samples is not equal to the shape of answers")
+    predicted = binarize(samples, threshold)
+    real = binarize(answers)
+
+    tp = np.count_nonzero(predicted & real, axis=0)
+    fp = np.count_nonzero(predicted, axis=0) - tp
+    fn = np.count_nonzero(real, axis=0) - tp
+    tn = samples.shape[0] - tp - fp - fn
+    return {'class': np.arange(samples.shape[1]),
+            'TP': tp.astype(np.float64), 'FP': fp.astype(np.float64),
+            'FN': fn.astype(np.float64), 'TN': tn.astype(np.float64)}
+
+
+def compute_class_metrics(results):
+    """Count per-class, macro and micro averaged metrics.
+
+    :param results: Dict from ConfusionMatrix.get_results or
+                    multilabel_results.
+    Macro metrics are means of not rounded metrics of classes. Metric
+    which is not defined for a class (class is never predicted or never
+    met) is counted as 0, like in sklearn.
+
+    :return: per-class metrics (dict with arrays), macro metrics,
+             micro metrics (dicts like in compute_metrics).
+    """
+    tp, fp, fn = results['TP'], results['FP'], results['FN']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = {'precision': tp / (tp + fp),
+                  'recall': tp / (tp + fn),
+                  # the same as harmonic mean, but is defined when class
+                  # is never predicted
+                  'harmonic_mean': 2 * tp / (2 * tp + fp + fn)}
+
+    per_class = compute_metrics(results)
+    per_class['class'] = results['class']
+    per_class['harmonic_mean'] = np.round(ratios['harmonic_mean'],
+                                          round_chars)
+    macro = dict((key, round(float(np.mean(np.nan_to_num(value))),
+                             round_chars))
+                 for key, value in ratios.items())
+    micro = compute_metrics(dict((key, results[key].sum())
+                                 for key in ('TP', 'FP', 'FN', 'TN')))
+    return per_class, macro, micro
+
+
+def write_curves(curves, file_path):
+    """Save points of curves to CSV file.
+
+    :param curves: Dict from compute_curves.
+    :param file_path: Path to CSV file.
+    """
+    keys = ('threshold', 'fpr', 'tpr', 'precision', 'recall')
+    np.savetxt(file_path, np.column_stack([curves[key] for key in keys]),
+               fmt='%.{0}g'.format(round_chars + 2), delimiter=',',
+               header=','.join(keys), comments='')
+
+
+def convert_with_best_threshold(args=None):
     """Get best threshold based on roc_auc_score.
 
     And convert to samples to bin using it.
 
-    :return: float, list, list
+    :param args: Dict from get_args. It is read from argv if not provided.
+    :return: float, numpy array, numpy array
     """
-    thresholds = np.arange(0.01, 1.00, 0.01)
-
-    samples, answers = get_answers_and_samples()
+    samples, answers = get_answers_and_samples(args)
     answers = convert_to_bin(answers)
 
-    print 'Calculating best threshold . . .'
-    threshold_score = {}
-    for threshold in thresholds:
-        score = roc_auc_score(
-            answers,
-            convert_to_bin(samples, threshold=threshold))
-        score = round(score, round_chars)
-        threshold_score[score] = round(threshold, 2)
-
-    values = threshold_score.keys()
-    best_value = max(values)
-    best_threshold = threshold_score[best_value]
-    print 'Calculating best threshold . . . it is "{0}"'.format(best_threshold)
+    print('Calculating best threshold . . .')
+    best_threshold, _ = find_best_threshold(samples, answers > 0)
+    print('Calculating best threshold . . . it is "{0}"'.format(
+        best_threshold))
 
     samples = convert_to_bin(samples, threshold=best_threshold)
 
     return best_threshold, answers, samples
 
 
+def stream_with_best_threshold(samples_file, answers_file,
+                               chunk_size=default_chunk_size,
+                               use_cache=True):
+    """Find best threshold like convert_with_best_threshold in huge files.
+
+    Files are read twice chunk by chunk: to find best threshold
+    and to count errors with it.
+
+    :return: float, dict with errors like in get_results.
+    """
+    print('Calculating best threshold . . .')
+    best_threshold, _ = choose_best_threshold(stream_sweep(
+        samples_file, answers_file,
+        chunk_size=chunk_size, use_cache=use_cache))
+    print('Calculating best threshold . . . it is "{0}"'.format(
+        best_threshold))
+
+    results = stream_results(samples_file, answers_file,
+                             threshold=best_threshold,
+                             chunk_size=chunk_size, use_cache=use_cache)
+    return best_threshold, results
+
+
+# Correct answers shared by all processes of batch mode.
+_batch_labels = None
+
+
+def _init_batch_worker(labels):
+    """Keep correct answers in process. They are sent once per process."""
+    global _batch_labels  # pylint: disable=global-statement
+    _batch_labels = labels
+
+
+def _score_batch_file(params):
+    """Score one file with samples against shared correct answers.
+
+    :param params: Tuple: path to file with samples, use_cache.
+    :return: Dict with file name, threshold and metrics.
+    """
+    samples_file, use_cache = params
+    samples = load_file(samples_file, use_cache=use_cache)
+    assert len(samples) == len(_batch_labels), (
+        "Number of samples is not equal to the number of answers: "
+        "{0}".format(samples_file))
+
+    index = ScoreIndex(samples, _batch_labels)
+    best_threshold, _ = choose_best_threshold(
+        index.sweep(default_thresholds()))
+    results = get_results(convert_to_bin(samples, threshold=best_threshold),
+                          _batch_labels)
+    row = compute_metrics(results)
+    row.update(results)
+    curves = index.curves(max_points=2)
+    row['roc_auc'] = curves['roc_auc']
+    row['pr_auc'] = curves['pr_auc']
+    row['file'] = samples_file
+    row['threshold'] = best_threshold
+    return row
+
+
+def score_batch(samples_files, answers_file, jobs=None, use_cache=True):
+    """Score many files with samples against the same correct answers.
+
+    Answers are read and converted to bin once. Files with samples are
+    scored in a pool of processes.
+
+    :param samples_files: List of paths to files with samples.
+    :param answers_file: Path to file with correct answers.
+    :param jobs: Number of processes. Number of CPUs by default.
+    :param use_cache: Read and write binary cache of parsed files.
+    :return: Generator of dicts (one per file, in the same order).
+    """
+    labels = binarize(load_file(answers_file, use_cache=use_cache))
+    params = [(samples_file, use_cache) for samples_file in samples_files]
+
+    jobs = min(jobs or multiprocessing.cpu_count(), len(params))
+    if jobs <= 1:
+        _init_batch_worker(labels)
+        for row in map(_score_batch_file, params):
+            yield row
+        return
+
+    pool = multiprocessing.Pool(jobs, _init_batch_worker, (labels,))
+    try:
+        for row in pool.imap(_score_batch_file, params):
+            yield row
+    finally:
+        pool.terminate()
+
+
+def print_batch_table(rows):
+    """Print results of all files as one table.
+
+    :param rows: Iterable of dicts from score_batch.
+    """
+    template = ('{file:<40} {threshold:>9} {precision:>9} {recall:>9} '
+                '{harmonic_mean:>9} {tpr:>9} {fpr:>9} {roc_auc:>9} '
+                '{pr_auc:>9}')
+    print(template.format(file='File with samples', threshold='Threshold',
+                          precision='Precision', recall='Recall',
+                          harmonic_mean='F1', tpr='TPR', fpr='FPR',
+                          roc_auc='ROC AUC', pr_auc='PR AUC'))
+    for row in rows:
+        print(template.format(**row))
+
+
+def print_operating_points(points):
+    """Print best thresholds for objectives.
+
+    :param points: Dict from ScoreIndex.select. Objectives without
+                   threshold (None) are printed as not reachable.
+    """
+    template = ('{name:<28} {threshold:>9} {precision:>9} {recall:>9} '
+                '{harmonic_mean:>9} {tpr:>9} {fpr:>9}')
+    print('Operating points:')
+    print(template.format(name='Objective', threshold='Threshold',
+                          precision='Precision', recall='Recall',
+                          harmonic_mean='F1', tpr='TPR', fpr='FPR'))
+    for name in sorted(points):
+        if points[name] is None:
+            print('{0:<28} not reachable'.format(name))
+        else:
+            print(template.format(name=name, **points[name]))
+
+
+def score_classes(args):
+    """Count errors of each class for multi-class or multi-label files.
+
+    :param args: Dict from get_args.
+    :return: Dict like in ConfusionMatrix.get_results.
+    """
+    samples = load_matrix(args['samples_file'])
+    if args['multilabel']:
+        return multilabel_results(samples, load_matrix(args['answers_file']),
+                                  threshold=args['threshold'])
+
+    answers = load_file(args['answers_file'], use_cache=args['use_cache'])
+    assert len(samples) == len(answers), (
+        "Number of samples is not equal to the number of answers")
+    classes = None
+    if samples.shape[1] > 1:
+        classes = np.arange(samples.shape[1])
+    return ConfusionMatrix(answers, get_predicted_classes(samples),
+                           classes=classes).get_results()
+
+
+def print_class_results(args, results):
+    """Print macro and micro averaged metrics (and metrics of classes).
+
+    :param args: Dict from get_args.
+    :param results: Dict from score_classes.
+    """
+    per_class, macro, micro = compute_class_metrics(results)
+    print((
+        "\nResults:\n"
+        "File with samples: {sample_file}\n"
+        "File with answers: {answer_file}\n"
+        "Classes: {classes}\n\n"
+        "Macro Precision: {macro[precision]}\n"
+        "Macro Recall:    {macro[recall]}\n"
+        "Macro Harmonic mean of Precision and Recall = "
+        "{macro[harmonic_mean]}\n\n"
+        "Micro Precision: {micro[precision]}\n"
+        "Micro Recall:    {micro[recall]}\n"
+        "Micro Harmonic mean of Precision and Recall = "
+        "{micro[harmonic_mean]}\n"
+    ).format(sample_file=args['samples_file'],
+             answer_file=args['answers_file'],
+             classes=per_class['class'].size,
+             macro=macro,
+             micro=micro))
+    if not args['per_class']:
+        return
+
+    template = '{0:>10} {1:>9} {2:>9} {3:>9} {4:>9} {5:>9}'
+    print(template.format('Class', 'Real', 'Predicted',
+                          'Precision', 'Recall', 'F1'))
+    rows = zip(per_class['class'],
+               results['TP'] + results['FN'], results['TP'] + results['FP'],
+               per_class['precision'], per_class['recall'],
+               per_class['harmonic_mean'])
+    for name, real, predicted, precision, recall, f1 in rows:
+        print(template.format(name, int(real), int(predicted),
+                              precision, recall, f1))
+
+
 def main():
-    sample_file = get_args()['samples_file']
-    answer_file = get_args()['answers_file']
+    args = get_args()
+    if args['online']:
+        run_online(sys.stdin, OnlineEvaluator(decay=args['decay'],
+                                              window=args['window']),
+                   batch_size=args['batch_size'])
+        return
+    if args['multiclass'] or args['multilabel']:
+        print_class_results(args, score_classes(args))
+        return
+
+    if args['batch']:
+        print_batch_table(score_batch(
+            args['samples_files'], args['answers_file'],
+            jobs=args['jobs'], use_cache=args['use_cache']))
+        return
+
+    sample_file = args['samples_file']
+    answer_file = args['answers_file']
 
-    best_threshold, answers, samples = convert_with_best_threshold()
+    curves = None
+    points = None
+    intervals = None
+    if args['chunk_size']:
+        best_threshold, results = stream_with_best_threshold(
+            sample_file, answer_file,
+            chunk_size=args['chunk_size'], use_cache=args['use_cache'])
+    else:
+        samples, answers = get_answers_and_samples(args)
+        answers = convert_to_bin(answers)
+        index = ScoreIndex(samples, answers > 0)
 
-    results = get_results(samples, answers)
+        print('Calculating best threshold . . .')
+        best_threshold, _ = choose_best_threshold(
+            index.sweep(default_thresholds()))
+        print('Calculating best threshold . . . it is "{0}"'.format(
+            best_threshold))
 
-    precision = count_precision(tp=results['TP'], fp=results['FP'])
-    recall = count_recall(tp=results['TP'], fn=results['FN'])
-    harmonic_mean = count_harmonic_mean(precision, recall)
+        results = get_results(
+            convert_to_bin(samples, threshold=best_threshold), answers)
+        curves = index.curves(max_points=args['curve_points'])
+        if args['curves_file']:
+            write_curves(curves, args['curves_file'])
+        points = index.select(args['objectives'])
+        if args['bootstrap']:
+            intervals = bootstrap_metrics(
+                samples, answers > 0, best_threshold,
+                iterations=args['bootstrap'], confidence=args['confidence'],
+                refit=args['bootstrap_refit'], jobs=args['jobs'],
+                seed=args['seed'])
 
-    tpr = count_tpr(tp=results['TP'], fn=results['FN'])
-    fpr = count_fpr(fp=results['FP'], tn=results['TN'])
+    metrics = compute_metrics(results)
 
-    print (
+    print((
         "\nResults:\n"
         "File with samples: {sample_file}\n"
         "File with answers: {answer_file}\n\n"
@@ -213,12 +1489,37 @@ def main():
         "False Positive Rate: {fpr}\n"
     ).format(sample_file=sample_file,
              answer_file=answer_file,
-             precision=precision,
-             recall=recall,
-             hm=harmonic_mean,
+             precision=metrics['precision'],
+             recall=metrics['recall'],
+             hm=metrics['harmonic_mean'],
              threshold=best_threshold,
-             fpr=fpr,
-             tpr=tpr)
+             fpr=metrics['fpr'],
+             tpr=metrics['tpr']))
+    if curves:
+        print((
+            "ROC AUC: {roc_auc}\n"
+            "PR AUC (average precision): {pr_auc}\n"
+        ).format(roc_auc=curves['roc_auc'], pr_auc=curves['pr_auc']))
+    if intervals:
+        print((
+            "Confidence intervals ({confidence:.0%}, {iterations} bootstrap "
+            "samples):\n"
+            "Precision: {precision}\n"
+            "Recall:    {recall}\n"
+            "Harmonic mean of Precision and Recall = {hm}\n"
+            "Threshold: {threshold}\n"
+            "True Positive Rate: {tpr}\n"
+            "False Positive Rate: {fpr}\n"
+        ).format(confidence=args['confidence'],
+                 iterations=args['bootstrap'],
+                 precision=intervals['precision'],
+                 recall=intervals['recall'],
+                 hm=intervals['harmonic_mean'],
+                 threshold=intervals['threshold'],
+                 tpr=intervals['tpr'],
+                 fpr=intervals['fpr']))
+    if points:
+        print_operating_points(points)
 
 
 if __name__ == "__main__":
@@ -226,3 +1527,4 @@ if __name__ == "__main__":
 
 # ./count_quality.py ./data/LogisticRegression_pred.csv ./data/test_labels.csv
 # ./count_quality.py ./data/NaiveBayes_pred.csv ./data/test_labels.csv
+# ./count_quality.py --answers ./data/test_labels.csv ./data/*_pred.csv
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""Tests of quality of work of a classifier."""
+
+import io
+import os
+
+import numpy as np
+import pytest
+from sklearn.metrics import (average_precision_score, f1_score,
+                             precision_score, recall_score, roc_auc_score)
+
+from tasks.task_1 import count_quality
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def make_data(size, seed=0, digits=2):
+    """Scores of a noisy classifier with ties and correct answers.
+
+    :return: numpy array of floats, numpy array of booleans
+    """
+    random = np.random.RandomState(seed)
+    labels = random.rand(size) < 0.7
+    samples = np.clip(labels * 0.3 + random.rand(size) * 0.7, 0, 1)
+    return np.round(samples, digits), labels
+
+
+def find_by_roc_auc_score(samples, labels):
+    """Find best threshold like the first version did (99 sorts)."""
+    threshold_score = {}
+    for threshold in np.arange(0.01, 1.00, 0.01):
+        score = roc_auc_score(labels, count_quality.convert_to_bin(
+            samples, threshold=threshold))
+        threshold_score[round(score, count_quality.round_chars)] = round(
+            threshold, 2)
+    return threshold_score[max(threshold_score)]
+
+
+def write_values(path, values):
+    """Write one number per line."""
+    path.write(''.join('{0!r}\n'.format(float(one)) for one in values))
+    return str(path)
+
+
+@pytest.mark.parametrize('seed, digits', [(0, 2), (1, 3), (2, 4)])
+def test_best_threshold(seed, digits):
+    """Best threshold is the same as with roc_auc_score for each one."""
+    samples, labels = make_data(2000, seed, digits)
+    best_threshold, sweep = count_quality.find_best_threshold(samples, labels)
+    assert best_threshold == find_by_roc_auc_score(samples, labels)
+    assert sweep['score'].size == 99
+
+
+def test_data_files():
+    """Best threshold of real classifier is found like before."""
+    samples = count_quality.load_file(
+        os.path.join(DATA_DIR, 'NaiveBayes_pred.csv'), use_cache=False)
+    labels = count_quality.load_file(
+        os.path.join(DATA_DIR, 'test_labels.csv'), use_cache=False) > 0
+    samples, labels = samples[::20], labels[::20]
+    assert count_quality.find_best_threshold(samples, labels)[0] \
+        == find_by_roc_auc_score(samples, labels)
+
+
+def test_get_results():
+    """Errors are counted for every pair of sample and answer."""
+    assert count_quality.get_results([1, 1, 0, 0, 1], [1, 0, 1, 0, 1]) \
+        == {'TP': 2.0, 'FP': 1.0, 'FN': 1.0, 'TN': 1.0}
+
+
+class TestFiles(object):
+    """Test reading of files: in memory, by chunks and from cache."""
+
+    @pytest.fixture
+    def files(self, tmpdir):
+        """Paths to files with samples and answers."""
+        samples, labels = make_data(1003, seed=3, digits=3)
+        return (write_values(tmpdir.join('samples.csv'), samples),
+                write_values(tmpdir.join('answers.csv'), labels))
+
+    @pytest.mark.parametrize('chunk_size', [1, 7, 1003, 5000])
+    def test_chunk_size(self, files, chunk_size, capsys):
+        """Results of streaming are the same as in memory."""
+        samples_file, answers_file = files
+        args = {'samples_file': samples_file, 'answers_file': answers_file,
+                'use_cache': False}
+        threshold, answers, binary = \
+            count_quality.convert_with_best_threshold(args)
+        streamed = count_quality.stream_with_best_threshold(
+            samples_file, answers_file, chunk_size=chunk_size,
+            use_cache=False)
+        assert streamed == (threshold,
+                            count_quality.get_results(binary, answers))
+        assert 'it is "{0}"'.format(threshold) in capsys.readouterr().out
+
+    def test_cache(self, tmpdir, files):
+        """Cache is used until file is changed, then it is replaced."""
+        samples_file = files[0]
+        values = count_quality.load_file(samples_file)
+        cache_path = count_quality._cache_path(samples_file)
+        assert os.path.isfile(cache_path)
+        assert isinstance(count_quality.load_file(samples_file), np.memmap)
+
+        with open(samples_file, 'a') as f:
+            f.write('0.5\n')
+        os.utime(samples_file, (2e9, 2e9))
+        changed = count_quality.load_file(samples_file)
+        assert list(changed) == list(values) + [0.5]
+        assert not os.path.exists(cache_path)
+        assert [name for name in os.listdir(str(tmpdir))
+                if name.endswith('.npy')] \
+            == [os.path.basename(count_quality._cache_path(samples_file))]
+
+    def test_cache_of_other_file(self, tmpdir, files):
+        """Caches of files with longer names are not removed."""
+        backup = tmpdir.join('samples.csv.bak')
+        backup.write('0.5\n')
+        count_quality.load_file(str(backup))
+        count_quality.load_file(files[0])
+        assert os.path.isfile(count_quality._cache_path(str(backup)))
+
+    def test_no_cache(self, tmpdir, files):
+        """Nothing is written with use_cache=False."""
+        count_quality.load_file(files[0], use_cache=False)
+        assert sorted(os.listdir(str(tmpdir))) \
+            == ['answers.csv', 'samples.csv']
+
+    @pytest.mark.parametrize('content', ['0.5\n\n0.7\n', '0.5\nabc\n'])
+    def test_wrong_line(self, tmpdir, content):
+        """Wrong lines are reported in memory and by chunks."""
+        path = tmpdir.join('wrong.csv')
+        path.write(content)
+        with pytest.raises(ValueError, match='Input is not a number'):
+            count_quality.load_file(str(path))
+        with pytest.raises(ValueError, match='Input is not a number'):
+            list(count_quality.iter_file_chunks(str(path), 2))
+        assert not tmpdir.listdir('*.npy')
+
+
+def test_batch(tmpdir):
+    """Every file is scored against the same answers."""
+    labels = make_data(500)[1]
+    answers_file = write_values(tmpdir.join('answers.csv'), labels)
+    samples_files = [write_values(tmpdir.join('{0}.csv'.format(seed)),
+                                  make_data(500, seed)[0])
+                     for seed in range(3)]
+    rows = list(count_quality.score_batch(samples_files, answers_file,
+                                          jobs=2, use_cache=False))
+    assert [row['file'] for row in rows] == samples_files
+    for row, seed in zip(rows, range(3)):
+        samples = make_data(500, seed)[0]
+        assert row['threshold'] \
+            == count_quality.find_best_threshold(samples, labels)[0]
+        assert row['roc_auc'] == round(roc_auc_score(labels, samples), 5)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_curves(seed):
+    """Areas under curves are the same as in sklearn."""
+    samples, labels = make_data(3000, seed)
+    curves = count_quality.compute_curves(samples, labels, max_points=10)
+    assert curves['roc_auc'] == round(roc_auc_score(labels, samples), 5)
+    assert curves['pr_auc'] \
+        == round(average_precision_score(labels, samples), 5)
+    assert curves['threshold'].size == 10
+    assert curves['threshold'][-1] == -np.inf
+    assert (curves['tpr'][-1], curves['fpr'][-1]) == (1.0, 1.0)
+
+
+class TestObjectives(object):
+    """Test choice of thresholds for objectives."""
+
+    INDEX = count_quality.ScoreIndex([.1, .2, .3, .9],
+                                     [True, False, True, True])
+
+    def test_all_positive(self):
+        """Threshold below all samples can be chosen."""
+        point = self.INDEX.select(
+            {'p': count_quality.precision_at_recall(1.0)})['p']
+        assert (point['threshold'], point['recall'], point['precision']) \
+            == (-np.inf, 1.0, 0.75)
+
+    def test_not_reachable(self, capsys):
+        """Objective which can not be met has no threshold."""
+        points = self.INDEX.select(
+            {'p': count_quality.precision_at_recall(1.5),
+             'f1': count_quality.get_objective('f1')})
+        assert points['p'] is None
+        assert points['f1']['threshold'] == -np.inf
+        count_quality.print_operating_points(points)
+        assert 'p                            not reachable' \
+            in capsys.readouterr().out
+
+    @pytest.mark.parametrize('spec', ['f2', 'f1:2', 'cost:x'])
+    def test_wrong_spec(self, spec):
+        """Unknown objectives and wrong parameters are errors."""
+        with pytest.raises(ValueError):
+            count_quality.get_objective(spec)
+
+    def test_one_class(self):
+        """ROC AUC is not defined when all answers are the same."""
+        with pytest.raises(ValueError):
+            count_quality.find_best_threshold([.1, .5, .9], [True] * 3)
+
+
+def test_bootstrap():
+    """Intervals contain metrics of all samples and depend on seed only."""
+    samples, labels = make_data(2000)
+    threshold = count_quality.find_best_threshold(samples, labels)[0]
+    metrics = count_quality.compute_metrics(count_quality.get_results(
+        count_quality.convert_to_bin(samples, threshold), labels))
+    intervals = count_quality.bootstrap_metrics(
+        samples, labels, threshold, iterations=200, seed=1)
+    for key, value in metrics.items():
+        assert intervals[key][0] <= value <= intervals[key][1]
+    assert intervals['threshold'] == (threshold, threshold)
+    assert count_quality.bootstrap_metrics(
+        samples, labels, threshold, iterations=200, seed=1, jobs=2,
+        refit=True) == count_quality.bootstrap_metrics(
+            samples, labels, threshold, iterations=200, seed=1, jobs=2,
+            refit=True)
+
+
+class TestOnline(object):
+    """Test incremental evaluator."""
+
+    def test_same_as_sweep(self):
+        """Counts of all batches are the same as of all samples at once."""
+        samples, labels = make_data(1000)
+        evaluator = count_quality.OnlineEvaluator()
+        for start in range(0, 1000, 300):
+            evaluator.update(samples[start:start + 300],
+                             labels[start:start + 300])
+        sweep = count_quality.sweep_thresholds(
+            samples, labels, count_quality.default_thresholds())
+        for key in ('TP', 'FP', 'FN', 'TN'):
+            assert list(evaluator.sweep()[key]) == list(sweep[key])
+
+    def test_decay(self):
+        """Old counts are multiplied by decay before each batch."""
+        evaluator = count_quality.OnlineEvaluator(decay=0.5)
+        for _ in range(2):
+            evaluator.update([0.9, 0.8], [1, 1])
+        assert evaluator.pos_hist.sum() == 3.0
+
+    def test_window(self):
+        """Only last batches are kept."""
+        evaluator = count_quality.OnlineEvaluator(window=1)
+        evaluator.update([0.9, 0.8, 0.1], [1, 1, 0])
+        evaluator.update([0.7], [1])
+        assert (evaluator.pos_hist.sum(), evaluator.total) == (1.0, 1.0)
+
+    def test_decay_and_window(self):
+        """Decay can not be used with window."""
+        with pytest.raises(AssertionError):
+            count_quality.OnlineEvaluator(decay=0.5, window=1)
+
+    def test_run_online(self):
+        """Batches of empty lines are skipped, not the end of stream."""
+        output = io.StringIO()
+        count_quality.run_online(['0.9,1\n', '\n', '0.2 0\n', '0.8,1\n'],
+                                 count_quality.OnlineEvaluator(),
+                                 batch_size=1, output=output)
+        lines = output.getvalue().splitlines()
+        assert lines[0] == 'samples=1 threshold is not defined yet'
+        assert [line.split()[0] for line in lines[1:]] \
+            == ['samples=2', 'samples=3']
+
+
+class TestClasses(object):
+    """Test multi-class and multi-label metrics."""
+
+    @pytest.mark.parametrize('answers, predictions', [
+        ([0, 1, 2, 2], [0, 1, 1, 1]),
+        ([0, 0, 1, 1, 2, 3], [0, 1, 1, 1, 1, 3]),
+        ([5, 3, 3, 7, 7, 7], [5, 3, 7, 7, 3, 9]),
+    ])
+    def test_macro_and_micro(self, answers, predictions):
+        """Averaged metrics are the same as in sklearn."""
+        results = count_quality.ConfusionMatrix(
+            answers, predictions).get_results()
+        _, macro, micro = count_quality.compute_class_metrics(results)
+        for key, score in [('precision', precision_score),
+                           ('recall', recall_score),
+                           ('harmonic_mean', f1_score)]:
+            for averaged, average in [(macro, 'macro'), (micro, 'micro')]:
+                assert averaged[key] == round(score(
+                    answers, predictions, average=average,
+                    zero_division=0), 5)
+
+    def test_sparse(self):
+        """Sparse matrix counts the same errors as dense one."""
+        random = np.random.RandomState(0)
+        answers = random.randint(0, 50, size=1000)
+        predictions = np.where(random.rand(1000) < 0.8, answers,
+                               random.randint(0, 50, size=1000))
+        dense = count_quality.ConfusionMatrix(answers, predictions,
+                                              sparse=False).get_results()
+        sparse = count_quality.ConfusionMatrix(answers, predictions,
+                                               sparse=True).get_results()
+        for key in ('class', 'TP', 'FP', 'FN', 'TN'):
+            assert list(dense[key]) == list(sparse[key])
+
+    def test_scores(self):
+        """Class with max score is predicted, not met classes are kept."""
+        predicted = count_quality.get_predicted_classes(
+            [[0.1, 0.9, 0.0], [0.8, 0.1, 0.1]])
+        assert list(predicted) == [1, 0]
+        results = count_quality.ConfusionMatrix(
+            [1, 1], predicted, classes=np.arange(3)).get_results()
+        assert list(results['class']) == [0, 1, 2]
+
+    def test_not_integer(self):
+        """Classes must be integers."""
+        with pytest.raises(ValueError):
+            count_quality.ConfusionMatrix([1.5], [1])
+
+    def test_multilabel(self):
+        """Labels are scored independently."""
+        samples = [[0.9, 0.2], [0.6, 0.7], [0.1, 0.4]]
+        answers = [[1, 0], [0, 1], [0, 1]]
+        results = count_quality.multilabel_results(samples, answers)
+        _, macro, _ = count_quality.compute_class_metrics(results)
+        predicted = np.array(samples) > 0.5
+        assert macro['harmonic_mean'] == round(
+            f1_score(answers, predicted, average='macro'), 5)